@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+"""Compare HTML parser backends of the HTTP spiders on saved middleman pages."""
+import hashlib
+import time
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+
+import httpx
+
+from bot.extract import AnchorParser
+from bot.registry import REGISTRY
+from bot.spider import AsyncSpider, Parser, get_parser, select_href
+from utils.urls import get_middleman
+
+PAGES_DIR: Path = Path(__file__).parent.parent / 'data' / 'pages'
+
+
+def parse_arguments() -> Namespace:
+    """Parse command-line arguments."""
+    parser: ArgumentParser = ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=Path, default=PAGES_DIR,
+                        help='Directory of pages saved as <middleman>-*.html')
+    parser.add_argument('--fetch', nargs='*', default=[],
+                        help='Middleman links to download into the pages directory first')
+    parser.add_argument('--repeat', type=int, default=20)
+    return parser.parse_args()
+
+
+def save_pages(urls: list[str], pages_dir: Path) -> None:
+    """Download middleman pages for later benchmarking."""
+    pages_dir.mkdir(parents=True, exist_ok=True)
+    with httpx.Client(follow_redirects=True, timeout=30) as client:
+        for url in urls:
+            digest: str = hashlib.sha1(url.encode()).hexdigest()[:8]
+            path: Path = pages_dir / f'{get_middleman(url)}-{digest}.html'
+            path.write_text(client.get(url).text, encoding='utf-8')
+            print(f'Saved {url} to {path}')
+
+
+def load_pages(pages_dir: Path) -> list[tuple[type[AsyncSpider], str]]:
+    """Return saved pages along with the spider whose selector applies to them."""
+    pages: list[tuple[type[AsyncSpider], str]] = []
+    for path in sorted(pages_dir.glob('*.html')):
+        spider = REGISTRY.get(path.stem.split('-', 1)[0])
+        if spider is None or not issubclass(spider, AsyncSpider) or not spider.selector:
+            print(f'Skipping {path.name}: no HTTP spider with a selector.')
+            continue
+        pages.append((spider, path.read_text(encoding='utf-8')))
+    return pages
+
+
+def stream(spider: type[AsyncSpider], html: str) -> str | None:
+    """Return href of the coupon anchor with the incremental streaming parser."""
+    parser: AnchorParser = AnchorParser(spider.selector, last=spider.match == 'last')
+    parser.feed(html)
+    return parser.href
+
+
+def main() -> None:
+    """Time every installed backend on the saved pages and print a comparison."""
+    args: Namespace = parse_arguments()
+    if args.fetch:
+        save_pages(args.fetch, args.pages)
+    pages: list[tuple[type[AsyncSpider], str]] = load_pages(args.pages)
+    if not pages:
+        print(f'No saved middleman pages in {args.pages}.')
+        return
+    backends: dict[str, Parser] = {}
+    for name in ('html.parser', 'lxml', 'selectolax'):
+        parser: Parser = get_parser(name)
+        if parser.name == name:
+            backends[name] = parser
+    results: dict[str, float] = {}
+    expected: list[str | None] = [
+        select_href(backends['html.parser'], html, spider.selector, spider.match)
+        for spider, html in pages]
+    for name, parser in backends.items():
+        start: float = time.perf_counter()
+        for _ in range(args.repeat):
+            hrefs = [select_href(parser, html, spider.selector, spider.match)
+                     for spider, html in pages]
+        results[name] = time.perf_counter() - start
+        if hrefs != expected:
+            print(f'Warning: {name} extracted different links than html.parser.')
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        hrefs = [stream(spider, html) for spider, html in pages]
+    results['stream'] = time.perf_counter() - start
+    baseline: float = results['html.parser']
+    runs: int = args.repeat * len(pages)
+    print(f'{len(pages)} pages x {args.repeat} runs')
+    for name, elapsed in sorted(results.items(), key=lambda item: item[1]):
+        print(f'{name:>12}: {elapsed / runs * 1000:8.3f} ms/page '
+              f'({baseline / elapsed:5.1f}x vs html.parser)')
+
+
+if __name__ == '__main__':
+    main()
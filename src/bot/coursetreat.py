@@ -1,30 +1,21 @@
 """Encapsulate the Course Treat spider methods and attributes."""
-import requests
-from bs4 import BeautifulSoup
-from gotify import Gotify
-from requests.exceptions import RequestException
+import httpx
 
-from bot.spider import Spider
-from config.bot import SpiderConfig
+from bot.spider import AsyncSpider
 
 
-class CourseTreat(Spider):
+class CourseTreat(AsyncSpider):
     """Course Treat spider to get Udemy links with coupons."""
 
-    def __init__(self, *, config: SpiderConfig, gotify: Gotify, urls: list[str]) -> None:
-        self.session = requests.Session()
-        super().__init__(gotify=gotify, config=config, urls=urls)
+    hosts = ('coursetreat',)
+    prefix = 'coursetreat'
+    selector = 'a.btn-couponbtn'
 
-    def transform(self, url: str) -> str | None:
+    async def transform(self, url: str) -> str | None:
         """Return Udemy link from Course Treat link."""
         for attempt in range(self.config.retries):
             try:
-                response: requests.Response = self.session.get(
-                    url, timeout=self.config.timeout)
-                html: str = response.text
-                soup: BeautifulSoup = BeautifulSoup(html, 'html.parser')
-                btn = soup.select_one('a.btn-couponbtn')
-                href: str = btn.get('href')
+                href: str | None = await self.extract(url)
                 # Ignore expired Udemy coupons
                 if href == 'udemy':
                     return None
@@ -33,7 +24,7 @@ class CourseTreat(Spider):
                 udemy_url: str | None = self.clean(href)
                 self.logger.info('%s ==> %s', url, udemy_url)
                 return udemy_url
-            except RequestException as e:
+            except httpx.HTTPError as e:
                 self.logger.error(
                     'Attempt %d: Error fetching %s: %s', attempt+1, url, str(e)
                 )
@@ -0,0 +1,77 @@
+"""Find the coupon anchor of a middleman page while it is still downloading."""
+import re
+from html.parser import HTMLParser
+
+SELECTOR_PATTERN: re.Pattern[str] = re.compile(
+    r'^(?P<tag>[\w-]+)?(?:#(?P<id>[\w-]+))?(?P<classes>(?:\.[\w-]+)*)$')
+
+
+class AnchorParser(HTMLParser):
+    """
+    Incrementally match a simple `tag#id.class` selector and keep the href of the first or
+    last matching element, so callers can stop feeding chunks as soon as `done` is set.
+    """
+
+    def __init__(self, selector: str, *, last: bool = False) -> None:
+        super().__init__()
+        match: re.Match[str] | None = SELECTOR_PATTERN.match(selector)
+        if not match:
+            raise ValueError(f'Unsupported selector for streaming extraction: {selector}')
+        self.tag = match['tag']
+        self.id = match['id']
+        self.classes = set(filter(None, match['classes'].split('.')))
+        self.last = last
+        self.found = False
+        self.done = False
+        self.href: str | None = None
+
+    def matches(self, tag: str, attrs: dict[str, str | None]) -> bool:
+        """Return a flag indicating whether an element matches the selector."""
+        if self.tag and tag != self.tag:
+            return False
+        if self.id and attrs.get('id') != self.id:
+            return False
+        return self.classes <= set((attrs.get('class') or '').split())
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if self.done or not self.matches(tag, dict(attrs)):
+            return
+        self.found = True
+        self.href = dict(attrs).get('href')
+        self.done = not self.last
+
+
+class AnchorTextParser(HTMLParser):
+    """
+    Incrementally find the href of the first anchor whose text contains a label, e.g.
+    'Get Course', and set `done` as soon as its closing tag is read.
+    """
+
+    def __init__(self, text: str) -> None:
+        super().__init__()
+        self.text = text.casefold()
+        self.inside = False
+        self.anchor: str | None = None
+        self.parts: list[str] = []
+        self.done = False
+        self.href: str | None = None
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if self.done or tag != 'a':
+            return
+        self.inside = True
+        self.anchor = dict(attrs).get('href')
+        self.parts = []
+
+    def handle_data(self, data: str) -> None:
+        if self.inside:
+            self.parts.append(data)
+
+    def handle_endtag(self, tag: str) -> None:
+        if self.done or tag != 'a' or not self.inside:
+            return
+        self.inside = False
+        label: str = ' '.join(''.join(self.parts).split()).casefold()
+        if self.anchor and self.text in label:
+            self.href = self.anchor
+            self.done = True
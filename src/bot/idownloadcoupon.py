@@ -1,30 +1,27 @@
 """Fetch Udemy links with coupons from IDownloadCoupon."""
-from urllib.parse import ParseResult, urlparse, parse_qs, unquote
+from urllib.parse import urljoin
 
-import requests
-from gotify import Gotify
-from requests.exceptions import RequestException
+import httpx
 
-from bot.spider import Spider
-from config.bot import SpiderConfig
+from bot.spider import AsyncSpider
+from utils.urls import UDEMY, get_middleman, unwrap
 
+MAX_REDIRECTS: int = 10
+# Redirect bodies up to this size are drained so the connection can be reused.
+MAX_DRAINED_BYTES: int = 4096
 
-class IDownloadCoupon(Spider):
+
+class IDownloadCoupon(AsyncSpider):
     """Get Udemy links with coupons from IDownloadCoupon."""
 
-    def __init__(self, *, config: SpiderConfig, urls: list[str],
-                 gotify: Gotify) -> None:
-        self.session = requests.Session()
-        super().__init__(config=config, gotify=gotify, urls=urls)
+    hosts = ('idownloadcoupon',)
+    prefix = 'idownloadcoupon'
 
-    def transform(self, url: str) -> str | None:
+    async def transform(self, url: str) -> str | None:
         """Convert IDownloadCoupon link to final Udemy link with coupon."""
         for attempt in range(self.config.retries):
             try:
-                response: requests.Response = self.session.get(
-                    url, allow_redirects=True, timeout=self.config.timeout)
-                clean_url: str = self.extract_udemy_link(
-                    self.clean(response.url))
+                clean_url: str = self.clean(await self.resolve(url))
                 self.logger.info('%s ==> %s', url, clean_url)
                 if 'idownloadcoupon' in clean_url:
                     self.logger.warning(
@@ -33,18 +30,28 @@ class IDownloadCoupon(Spider):
                     )
                     continue
                 return clean_url
-            except RequestException as e:
+            except httpx.HTTPError as e:
                 self.logger.error(
                     'Attempt %d: Error fetching %s: %s', attempt+1, url, str(e)
                 )
                 continue
         return None
 
-    def extract_udemy_link(self, url: str) -> str:
-        """Return Udemy link from LinkSynergy affiliate link."""
-        parsed_url: ParseResult = urlparse(url)
-        query_params: dict = parse_qs(parsed_url.query)
-        murl: str | None = query_params.get('murl', [None])[0]
-        if murl:
-            return unquote(murl)
+    def is_final(self, url: str) -> bool:
+        """Return a flag indicating whether a hop is a Udemy link, directly or once decoded."""
+        return get_middleman(unwrap(url)) == UDEMY
+
+    async def resolve(self, url: str) -> str:
+        """Follow Location headers hop by hop without downloading landing pages."""
+        for _hop in range(MAX_REDIRECTS):
+            async with self.stream(url, follow_redirects=False) as response:
+                location: str | None = response.headers.get('location')
+                if not response.is_redirect or not location:
+                    return str(response.url)
+                length: str = response.headers.get('content-length', '')
+                if length.isdigit() and int(length) <= MAX_DRAINED_BYTES:
+                    await response.aread()
+            url = urljoin(url, location)
+            if self.is_final(url):
+                return url
         return url
@@ -1,36 +1,27 @@
 """Scrape Udemy links with coupons from Invent High."""
-import requests
-from bs4 import BeautifulSoup
-from gotify import Gotify
-from requests.exceptions import RequestException
+import httpx
 
-from bot.spider import Spider
-from config.bot import SpiderConfig
+from bot.spider import AsyncSpider
 
 
-class InventHigh(Spider):
+class InventHigh(AsyncSpider):
     """Get Udemy links with coupons from Invent High."""
 
-    def __init__(self, *, config: SpiderConfig, gotify: Gotify, urls: list[str]) -> None:
-        self.session = requests.Session()
-        super().__init__(config=config, gotify=gotify, urls=urls)
+    hosts = ('inventhigh',)
+    prefix = 'inventhigh'
+    selector = 'a#couponval'
 
-    def transform(self, url: str) -> str | None:
+    async def transform(self, url: str) -> str | None:
         """Return Udemy link from Invent High link."""
         for attempt in range(self.config.retries):
             try:
-                response: requests.Response = self.session.get(
-                    url, timeout=self.config.timeout)
-                html: str = response.text
-                soup: BeautifulSoup = BeautifulSoup(html, 'html.parser')
-                button = soup.select_one('a#couponval')
-                href: str | None = button.get('href') if button else None
+                href: str | None = await self.extract(url)
                 if not href:
                     continue
                 udemy_url: str = self.clean(href)
                 self.logger.info('%s ==> %s', url, udemy_url)
                 return udemy_url
-            except RequestException as e:
+            except httpx.HTTPError as e:
                 self.logger.error(
                     'Attempt %d: Error fetching %s: %s', attempt+1, url, str(e)
                 )
@@ -0,0 +1,74 @@
+"""Adapt the number of in-flight requests to a middleman based on its latency and errors."""
+import asyncio
+import time
+from logging import Logger
+
+LATENCY_SMOOTHING: float = 0.2
+LATENCY_SPIKE_FACTOR: float = 2.0
+DECREASE_FACTOR: float = 0.5
+WARMUP_SAMPLES: int = 5
+
+
+class AdaptiveLimiter:
+    """
+    Additive-increase/multiplicative-decrease concurrency limit for one host.
+
+    Every healthy response raises the limit by 1/limit, i.e. by about one request per round trip.
+    Errors, throttling responses and latencies above twice the smoothed latency halve it, at most
+    once per smoothed round trip so a burst of failures counts as a single congestion signal.
+    """
+
+    def __init__(self, *, name: str, initial: int, maximum: int, logger: Logger) -> None:
+        self.name = name
+        self.maximum = max(1, maximum)
+        self.limit = float(min(max(1, initial), self.maximum))
+        self.logger = logger
+        self.in_flight = 0
+        self.latency: float | None = None
+        self.samples = 0
+        self.last_decrease = 0.0
+        self.peak = int(self.limit)
+        self.decreases = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """Wait until a request slot is free under the current limit."""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, *, latency: float, ok: bool) -> None:
+        """Free a request slot and adjust the limit to the outcome of the request."""
+        async with self.condition:
+            self.in_flight -= 1
+            previous: int = int(self.limit)
+            spike: bool = (self.samples >= WARMUP_SAMPLES and self.latency is not None
+                           and latency > LATENCY_SPIKE_FACTOR * self.latency)
+            if not ok or spike:
+                self.decrease()
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            if ok:
+                self.latency = latency if self.latency is None else \
+                    (1 - LATENCY_SMOOTHING) * self.latency + LATENCY_SMOOTHING * latency
+                self.samples += 1
+            current: int = int(self.limit)
+            self.peak = max(self.peak, current)
+            if current != previous:
+                self.logger.debug('%s concurrency limit %d -> %d (latency %.2fs, smoothed %.2fs).',
+                                  self.name, previous, current, latency, self.latency or 0.0)
+            self.condition.notify_all()
+
+    def decrease(self) -> None:
+        """Halve the limit unless it was already halved within the last round trip."""
+        now: float = time.monotonic()
+        if now - self.last_decrease < (self.latency or 0.0):
+            return
+        self.last_decrease = now
+        self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+        self.decreases += 1
+
+    def as_dict(self) -> dict[str, int | float]:
+        """Return limiter state for logging."""
+        return {'limit': int(self.limit), 'peak': self.peak, 'decreases': self.decreases,
+                'latency': round(self.latency or 0.0, 3)}
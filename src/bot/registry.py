@@ -0,0 +1,29 @@
+"""Map middleman hostnames to the spiders that resolve their links."""
+from typing import Final
+
+from bot.coursecouponz import CourseCouponz
+from bot.coursetreat import CourseTreat
+from bot.easy_learning import EasyLearning
+from bot.freewebcart import Freewebcart
+from bot.idownloadcoupon import IDownloadCoupon
+from bot.invent_high import InventHigh
+from bot.line51 import Line51
+from bot.real_discount import RealDiscount
+from bot.spider import BaseSpider
+from bot.webhelperapp import WebHelperApp
+
+SPIDERS: Final[tuple[type[BaseSpider], ...]] = (
+    CourseCouponz,
+    CourseTreat,
+    EasyLearning,
+    Freewebcart,
+    IDownloadCoupon,
+    InventHigh,
+    Line51,
+    RealDiscount,
+    WebHelperApp
+)
+
+REGISTRY: Final[dict[str, type[BaseSpider]]] = {
+    host: spider for spider in SPIDERS for host in spider.hosts
+}
@@ -1,67 +1,489 @@
 """Encapsulate common attributes and functionality between middleman spiders."""
+import asyncio
+import importlib
+import importlib.util
+import re
+import time
 from abc import ABC, abstractmethod
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from urllib.parse import ParseResult, urlparse, parse_qs, urlencode, urlunparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from queue import Queue
+from typing import Any, AsyncIterator, Callable, ClassVar, Mapping, TypeVar
+from urllib.parse import ParseResult, urlparse
 
+import httpx
+import undetected_chromedriver as uc
+from bs4 import BeautifulSoup
 from gotify import Gotify
+from selenium.webdriver.support.ui import WebDriverWait
 
+from bot.extract import AnchorParser, AnchorTextParser
+from bot.limiter import AdaptiveLimiter
+from client.http import HttpClient
 from config.bot import SpiderConfig
+from utils.cache import Cache
 from utils.logger import setup_logging
+from utils.urls import clean_udemy_url, unwrap
+from web.browser import BROWSER_ERRORS, BrowserPool
 
+T = TypeVar('T')
 
-class Spider(ABC):
-    """Encapsulates shared attributes and abstract methods for intermediary scrapers."""
 
-    def __init__(self, *, config: SpiderConfig, gotify: Gotify, urls: list[str]) -> None:
+class Parser(ABC):
+    """Select elements from a middleman page and expose their attributes."""
+
+    name: ClassVar[str]
+
+    @abstractmethod
+    def select(self, html: str, selector: str) -> list[Mapping[str, Any]]:
+        """Return attributes of every element matching the CSS selector."""
+
+    @abstractmethod
+    def select_one(self, html: str, selector: str) -> Mapping[str, Any] | None:
+        """Return attributes of the first element matching the CSS selector."""
+
+
+class SoupParser(Parser):
+    """Parse with Beautiful Soup on top of the given tree builder."""
+
+    def __init__(self, features: str = 'html.parser') -> None:
+        self.name = features
+        self.features = features
+
+    def select(self, html: str, selector: str) -> list[Mapping[str, Any]]:
+        return [element.attrs for element in
+                BeautifulSoup(html, self.features).select(selector)]
+
+    def select_one(self, html: str, selector: str) -> Mapping[str, Any] | None:
+        element = BeautifulSoup(html, self.features).select_one(selector)
+        return element.attrs if element else None
+
+
+class SelectolaxParser(Parser):
+    """Parse with the C-based Lexbor engine of selectolax."""
+
+    name = 'selectolax'
+
+    def __init__(self) -> None:
+        self.parser_class = importlib.import_module(
+            'selectolax.lexbor').LexborHTMLParser
+
+    def select(self, html: str, selector: str) -> list[Mapping[str, Any]]:
+        return [node.attributes for node in self.parser_class(html).css(selector)]
+
+    def select_one(self, html: str, selector: str) -> Mapping[str, Any] | None:
+        node = self.parser_class(html).css_first(selector)
+        return node.attributes if node else None
+
+
+PARSER_MODULES: dict[str, str] = {
+    'selectolax': 'selectolax', 'lxml': 'lxml', 'html.parser': 'html.parser'}
+
+
+@lru_cache(maxsize=None)
+def get_parser(name: str = 'auto') -> Parser:
+    """Return parser backend by name, falling back to html.parser if it is not installed."""
+    candidates: list[str] = list(PARSER_MODULES) if name == 'auto' else [name, 'html.parser']
+    for candidate in candidates:
+        if candidate == 'html.parser':
+            return SoupParser()
+        if importlib.util.find_spec(PARSER_MODULES.get(candidate, candidate)) is None:
+            if name != 'auto':
+                setup_logging().warning(
+                    'HTML parser %s requested but not installed. Using html.parser.', name)
+            continue
+        return SelectolaxParser() if candidate == 'selectolax' else SoupParser(candidate)
+    return SoupParser()
+
+
+def select_href(parser: Parser, html: str, selector: str, match: str = 'first') -> str | None:
+    """Return href of the first or last anchor matching `selector` in an HTML document."""
+    if match == 'last':
+        elements: list[Mapping[str, Any]] = parser.select(html, selector)
+        element: Mapping[str, Any] | None = elements[-1] if elements else None
+    else:
+        element = parser.select_one(html, selector)
+    return element.get('href') if element else None
+
+
+class BaseSpider(ABC):
+    """Encapsulates shared attributes and reporting for intermediary scrapers."""
+
+    # First hostname labels of the middleman links handled by the spider.
+    hosts: ClassVar[tuple[str, ...]] = ()
+    # Prefix of the <prefix>_retries, <prefix>_threads and <prefix>_timeout settings.
+    prefix: ClassVar[str] = ''
+    # Whether the spider drives headless browsers leased from a pool.
+    pooled: ClassVar[bool] = False
+
+    def __init__(self, *, config: SpiderConfig, gotify: Gotify, urls: list[str],
+                 http: HttpClient, queue: Queue[str | None] | None = None) -> None:
         self.config = config
         self.gotify = gotify
+        self.http = http
+        self.queue = queue
         self.urls = urls
         self.name = self.__class__.__name__
+        self.cache = Cache()
         self.logger = setup_logging()
 
     def clean(self, url: str) -> str:
-        """Return clean Udemy link with coupon code."""
-        parsed: ParseResult = urlparse(url)
-        params: dict[str, list[str]] = parse_qs(parsed.query)
-        udemy_url: str = params.get('u', [url])[0]
-        udemy_parsed: ParseResult = urlparse(udemy_url)
+        """Return clean Udemy link with coupon code, unwrapping affiliate links locally."""
+        return clean_udemy_url(unwrap(url))
 
-        udemy_params: dict[str, list[str]] = parse_qs(udemy_parsed.query)
+    def lookup(self) -> dict[str, str]:
+        """Return Udemy links of middleman links that are cached and fresh."""
+        resolutions: dict[str, str] = self.cache.get_resolutions(
+            urls=list(self.urls), ttl=self.config.cache_ttl)
+        self.logger.info('%s resolved %d/%d intermediary links from cache.',
+                         self.name, len(resolutions), len(self.urls))
+        return resolutions
 
-        clean_params: dict[str, list[str]] = {}
-        if 'couponCode' in udemy_params:
-            clean_params['couponCode'] = udemy_params['couponCode']
+    def collect(self, url: str, udemy_url: str) -> None:
+        """Cache freshly resolved Udemy link and hand it to the enrollment pipeline."""
+        self.cache.set_resolution(middleman_url=url, udemy_url=udemy_url)
+        self.publish(udemy_url)
 
-        clean_query: str = urlencode(clean_params, doseq=True)
-
-        return urlunparse(
-            udemy_parsed._replace(query=clean_query)
-        )
+    def publish(self, udemy_url: str) -> None:
+        """Hand resolved Udemy link to the enrollment pipeline, if any."""
+        if self.queue is not None:
+            self.queue.put(udemy_url)
 
-    def run(self) -> list[str]:
-        """Return list of Udemy links extracted from middleman website."""
+    def report_start(self) -> None:
+        """Log and notify that the spider started processing its links."""
         self.logger.info('Processing %d intermediary links from %s...',
                          len(self.urls), self.name)
         self.gotify.create_message(
             title=f'{self.name} spider started',
             message=f'Processing {len(self.urls)} intermediary links from {self.name}.'
         )
-        udemy_urls: list[str] = []
-        with ThreadPoolExecutor(max_workers=self.config.threads) as executor:
-            futures = {executor.submit(
-                self.transform, url): url for url in self.urls}
-            for future in as_completed(futures):
-                result: str | None = future.result()
-                if result:
-                    udemy_urls.append(result)
+
+    def report_finish(self, udemy_urls: list[str]) -> None:
+        """Log and notify how many Udemy links the spider scraped."""
         self.logger.info('%s spider scraped %d Udemy links.',
                          self.name, len(udemy_urls))
         self.gotify.create_message(
             title=f'{self.name} spider finished',
             message=f'Scraped {len(udemy_urls)} Udemy links from {self.name}.'
         )
+
+    @abstractmethod
+    async def crawl(self) -> list[str]:
+        """
+        Return list of Udemy links extracted from middleman website. Spiders share the pooled
+        HTTP client of Udemate, so they must be crawled on its event loop.
+        """
+
+
+THROTTLE_STATUSES: frozenset[int] = frozenset({429, 503})
+# WordPress caps per_page of the REST API at 100.
+WORDPRESS_BATCH_SIZE: int = 100
+
+
+class AsyncSpider(BaseSpider):
+    """Transform intermediary links concurrently on a shared event loop."""
+
+    limiter: AdaptiveLimiter
+    # CSS selector of the anchor holding the Udemy link, and whether its first or last match counts.
+    selector: ClassVar[str] = ''
+    match: ClassVar[str] = 'first'
+    # Whether the middleman is a WordPress site whose posts can be pulled in bulk from wp-json.
+    wordpress: ClassVar[bool] = False
+    prefetched: dict[str, str | None]
+
+    async def fetch(self, url: str, **kwargs: Any) -> httpx.Response:
+        """GET a middleman page within the adaptive concurrency limit of its host."""
+        await self.limiter.acquire()
+        start: float = time.monotonic()
+        ok: bool = False
+        try:
+            response: httpx.Response = await self.http.client.get(
+                url, timeout=self.config.timeout, **kwargs)
+            ok = response.status_code not in THROTTLE_STATUSES
+            return response
+        finally:
+            await self.limiter.release(latency=time.monotonic() - start, ok=ok)
+
+    @asynccontextmanager
+    async def stream(self, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """Stream a middleman page within the adaptive concurrency limit of its host."""
+        await self.limiter.acquire()
+        start: float = time.monotonic()
+        ok: bool = False
+        try:
+            async with self.http.client.stream(
+                    'GET', url, timeout=self.config.timeout, **kwargs) as response:
+                ok = response.status_code not in THROTTLE_STATUSES
+                yield response
+        finally:
+            await self.limiter.release(latency=time.monotonic() - start, ok=ok)
+
+    def select_href(self, html: str) -> str | None:
+        """Return href of the anchor matching the spider selector in an HTML document."""
+        return select_href(get_parser(self.config.parser), html, self.selector, self.match)
+
+    async def fetch_posts(self, origin: str, slugs: list[str]) -> dict[str, str]:
+        """Return coupon hrefs by slug from a batch of WordPress posts."""
+        try:
+            response: httpx.Response = await self.fetch(
+                f'{origin}/wp-json/wp/v2/posts',
+                params={'slug': ','.join(slugs), 'per_page': len(slugs),
+                        '_fields': 'slug,content'})
+            response.raise_for_status()
+            posts: list[dict[str, Any]] = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self.logger.warning('%s could not fetch posts from %s/wp-json: %s',
+                                self.name, origin, e)
+            return {}
+        hrefs: dict[str, str] = {}
+        for post in posts:
+            href: str | None = self.select_href(
+                post.get('content', {}).get('rendered', ''))
+            if href:
+                hrefs[post['slug']] = href
+        return hrefs
+
+    async def prefetch(self, urls: list[str]) -> None:
+        """Answer links from bulk WordPress REST batches, leaving the rest to the per-page path."""
+        self.prefetched = {}
+        if not (self.wordpress and self.config.bulk and urls):
+            return
+        batches: dict[str, dict[str, list[str]]] = {}
+        for url in urls:
+            parsed: ParseResult = urlparse(url)
+            slug: str = parsed.path.rstrip('/').rsplit('/', 1)[-1]
+            if slug:
+                batches.setdefault(f'{parsed.scheme}://{parsed.netloc}', {}) \
+                    .setdefault(slug, []).append(url)
+        requests: list[tuple[str, dict[str, list[str]]]] = []
+        for origin, slugs in batches.items():
+            items: list[tuple[str, list[str]]] = list(slugs.items())
+            for i in range(0, len(items), WORDPRESS_BATCH_SIZE):
+                requests.append((origin, dict(items[i:i+WORDPRESS_BATCH_SIZE])))
+        results: list[dict[str, str]] = await asyncio.gather(
+            *(self.fetch_posts(origin, list(batch)) for origin, batch in requests))
+        for (_origin, batch), hrefs in zip(requests, results):
+            for slug, href in hrefs.items():
+                for url in batch.get(slug, []):
+                    self.prefetched[url] = href
+        self.logger.info('%s resolved %d/%d links from %d WordPress REST requests.',
+                         self.name, len(self.prefetched), len(urls), len(requests))
+
+    def drain_limit(self, response: httpx.Response) -> int:
+        """
+        Return how many bytes of a streamed page may be downloaded once its anchor is found.
+        HTTP/1.1 connections are only reused after the whole body is read, so small rests are
+        drained, while HTTP/2 streams are reset without losing the connection.
+        """
+        if response.http_version == 'HTTP/2':
+            return 0
+        length: str = response.headers.get('content-length', '')
+        if length.isdigit() and int(length) - response.num_bytes_downloaded > self.config.drain:
+            return 0
+        return response.num_bytes_downloaded + self.config.drain
+
+    async def extract(self, url: str) -> str | None:
+        """Return href of the anchor matching the spider selector on a middleman page."""
+        if url in self.prefetched:
+            return self.prefetched[url]
+        if self.config.stream:
+            parser: AnchorParser = AnchorParser(
+                self.selector, last=self.match == 'last')
+            async with self.stream(url) as response:
+                limit: int | None = None
+                async for chunk in response.aiter_text():
+                    if limit is None:
+                        parser.feed(chunk)
+                        if not parser.done:
+                            continue
+                        limit = self.drain_limit(response)
+                    # Leaving the block early closes the connection without downloading the rest.
+                    if response.num_bytes_downloaded > limit:
+                        break
+            return parser.href
+        response: httpx.Response = await self.fetch(url)
+        return self.select_href(response.text)
+
+    async def crawl(self) -> list[str]:
+        """Return list of Udemy links, adapting requests in flight between 1 and `max_threads`."""
+        self.limiter = AdaptiveLimiter(name=self.name, initial=self.config.threads,
+                                       maximum=self.config.max_threads, logger=self.logger)
+        await asyncio.to_thread(self.report_start)
+        resolutions: dict[str, str] = await asyncio.to_thread(self.lookup)
+        for udemy_url in resolutions.values():
+            await asyncio.to_thread(self.publish, udemy_url)
+        await self.prefetch([url for url in self.urls if url not in resolutions])
+
+        async def transform_and_collect(url: str) -> str | None:
+            udemy_url: str | None = await self.transform(url)
+            if udemy_url:
+                await asyncio.to_thread(self.collect, url, udemy_url)
+            return udemy_url
+
+        results: list[str | None] = await asyncio.gather(
+            *(transform_and_collect(url) for url in self.urls if url not in resolutions)
+        )
+        udemy_urls: list[str] = list(resolutions.values()) + \
+            [result for result in results if result]
+        self.logger.info('%s concurrency: %s', self.name, self.limiter.as_dict())
+        await asyncio.to_thread(self.report_finish, udemy_urls)
         return sorted(set(udemy_urls))
 
     @abstractmethod
-    def transform(self, url: str) -> str | None:
+    async def transform(self, url: str) -> str | None:
         """Return a Udemy link extracted from middleman link."""
+
+
+# Responses and page markers of anti-bot challenges that only a real browser can pass.
+CHALLENGE_STATUSES: frozenset[int] = frozenset({403, 429, 503})
+CHALLENGE_MARKERS: tuple[str, ...] = (
+    'challenge-platform', 'cf-chl', '<title>Just a moment', 'cf-browser-verification')
+# Udemy link with coupon in page scripts or JSON payloads, possibly with escaped slashes.
+EMBEDDED_UDEMY_PATTERN: re.Pattern[str] = re.compile(
+    r'https?:\\?/\\?/(?:www\.)?udemy\.com\\?/course\\?/[^"\'\s<>]*?couponCode=[\w-]+')
+# Return href of the first anchor whose text contains arguments[0], or null while it is missing.
+FIND_HREF_SCRIPT: str = """
+for (const anchor of document.querySelectorAll('a[href]')) {
+    if (anchor.textContent.replace(/\\s+/g, ' ').includes(arguments[0])) return anchor.href;
+}
+return null;
+"""
+POLL_INTERVAL: float = 0.1
+
+
+class Challenged(Exception):
+    """Raised when a middleman answers a plain HTTP request with an anti-bot challenge."""
+
+
+class BrowserSpider(AsyncSpider):
+    """
+    Resolve links of middlemen that may need a browser in two tiers. The server HTML is fetched
+    over HTTP first and only a miss or an anti-bot challenge escalates to a leased headless driver.
+
+    A challenge is solved in the browser once, after which its clearance cookies and user agent
+    are handed to the HTTP client so the remaining links go back to plain requests. It is solved
+    again only when a request made with the current clearance is challenged.
+    """
+
+    # Text of the anchor holding the Udemy link.
+    link_text: ClassVar[str] = ''
+    pooled = True
+    executor: ThreadPoolExecutor
+
+    def __init__(self, *, pool: BrowserPool, config: SpiderConfig, gotify: Gotify,
+                 urls: list[str], http: HttpClient,
+                 queue: Queue[str | None] | None = None) -> None:
+        self.pool = pool
+        self.tiers: Counter[str] = Counter()
+        # User agent the clearance cookies are bound to, and how many times they were renewed.
+        self.headers: dict[str, str] = {}
+        self.clearance = 0
+        self.solving = asyncio.Lock()
+        super().__init__(config=config, gotify=gotify, urls=urls, http=http, queue=queue)
+
+    async def fetch_href(self, url: str) -> str | None:
+        """Return href of the coupon anchor in the server HTML, or None on a miss."""
+        parser: AnchorTextParser = AnchorTextParser(self.link_text)
+        chunks: list[str] = []
+        async with self.stream(url, headers=self.headers) as response:
+            if response.status_code in CHALLENGE_STATUSES:
+                raise Challenged(url)
+            async for chunk in response.aiter_text():
+                parser.feed(chunk)
+                if parser.done:
+                    break
+                chunks.append(chunk)
+        if parser.href:
+            return parser.href
+        html: str = ''.join(chunks)
+        if any(marker in html for marker in CHALLENGE_MARKERS):
+            raise Challenged(url)
+        match: re.Match[str] | None = EMBEDDED_UDEMY_PATTERN.search(html)
+        return match[0].replace('\\/', '/') if match else None
+
+    async def fetch_cleared(self, url: str) -> tuple[str | None, str]:
+        """
+        Return coupon href and its tier, solving a challenge in the browser for every request.
+        The tier is 'browser' only when the page was rendered to solve its challenge.
+        """
+        clearance: int = self.clearance
+        try:
+            return await self.fetch_href(url), 'http'
+        except Challenged:
+            self.tiers['challenge'] += 1
+        async with self.solving:
+            # Requests challenged before another one renewed the clearance just retry with it.
+            if clearance == self.clearance:
+                href, cookies, user_agent = await self.browse(self.solve, url)
+                self.http.import_cookies(cookies)
+                self.headers = {'User-Agent': user_agent}
+                self.clearance += 1
+                self.logger.info('%s solved a challenge and handed %d cookies to the HTTP client.',
+                                 self.name, len(cookies))
+                return href, 'browser'
+        try:
+            return await self.fetch_href(url), 'http'
+        except Challenged:
+            return None, 'http'
+
+    async def browse(self, function: Callable[[str], T], url: str) -> T:
+        """Run a blocking browser function on the executor of the spider."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, url)
+
+    def find_href(self, driver: uc.Chrome) -> str | None:
+        """Poll the DOM for the coupon anchor so extraction does not wait for the page load."""
+        wait: WebDriverWait = WebDriverWait(
+            driver, self.config.timeout, poll_frequency=POLL_INTERVAL)
+        return wait.until(lambda page: page.execute_script(FIND_HREF_SCRIPT, self.link_text))
+
+    def render(self, url: str) -> str | None:
+        """Return href of the coupon anchor rendered in a leased headless driver."""
+        with self.pool.lease() as driver:
+            driver.get(url)
+            return self.find_href(driver)
+
+    def solve(self, url: str) -> tuple[str | None, list[dict[str, Any]], str]:
+        """Pass the challenge of a page and return its coupon href, cookies and user agent."""
+        with self.pool.lease() as driver:
+            driver.get(url)
+            WebDriverWait(driver, self.config.timeout).until(
+                lambda page: not any(marker in page.page_source for marker in CHALLENGE_MARKERS))
+            href: str | None = self.find_href(driver)
+            return href, driver.get_cookies(), driver.execute_script('return navigator.userAgent')
+
+    async def transform(self, url: str) -> str | None:
+        """Return Udemy link over HTTP if possible, otherwise from a headless browser."""
+        for attempt in range(self.config.retries):
+            href: str | None = None
+            tier: str = 'http'
+            try:
+                if attempt == 0:
+                    try:
+                        href, tier = await self.fetch_cleared(url)
+                    except httpx.HTTPError as e:
+                        self.logger.warning('HTTP tier failed for %s: %s', url, str(e))
+                # Solving a challenge already rendered the page, so it is not loaded twice.
+                if not href and tier != 'browser':
+                    tier = 'browser'
+                    href = await self.browse(self.render, url)
+            except BROWSER_ERRORS as e:
+                self.logger.error('Attempt %d: Browser error for %s: %r', attempt+1, url, e)
+                continue
+            if not href:
+                continue
+            self.tiers[tier] += 1
+            udemy_url: str = self.clean(href)
+            self.logger.info('%s ==> %s (%s)', url, udemy_url, tier)
+            return udemy_url
+        self.tiers['failed'] += 1
+        return None
+
+    async def crawl(self) -> list[str]:
+        """Return list of Udemy links, rendering at most `threads` pages in browsers at once."""
+        with ThreadPoolExecutor(max_workers=self.config.threads,
+                                thread_name_prefix=self.name) as self.executor:
+            udemy_urls: list[str] = await super().crawl()
+        self.logger.info('%s tiers: %s', self.name, dict(self.tiers))
+        return udemy_urls
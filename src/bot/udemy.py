@@ -1,10 +1,12 @@
 """Automatically enroll into free Udemy courses."""
-import random
 import time
 from pathlib import Path
+from typing import Any, Callable, Iterable
+from urllib.parse import parse_qs, urlparse
 
 import undetected_chromedriver as uc
-from selenium.common.exceptions import WebDriverException
+from selenium.common.exceptions import (StaleElementReferenceException,
+                                        TimeoutException, WebDriverException)
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -14,21 +16,53 @@ from client.gotify import GotifyClient
 from config.bot import BotConfig
 from utils.cache import Cache
 from utils.logger import setup_logging
+from utils.timing import Backoff, StageTimer
+from web.browser import BROWSER_ERRORS, is_alive
+from web.memory import driver_memory
+
+CODE_INPUT_SELECTOR: str = (
+    'input.ud-text-input.ud-text-input-medium.ud-text-sm.ud-compact-form-control'
+)
+COOKIE_KEYS: tuple[str, ...] = (
+    'name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'expiry', 'sameSite'
+)
+# Set only while a Udemy account is logged in.
+SESSION_COOKIE: str = 'access_token'
+BUY_BUTTON_XPATH: str = (
+    "//button[@data-purpose='buy-now-button' or @data-purpose='buy-this-course-button']"
+)
 
 
 class Udemy:
     """Autoenroll into free Udemy courses."""
 
-    def __init__(self, *, driver: uc.Chrome, urls: list[str],
-                 config: BotConfig, gotify: GotifyClient) -> None:
+    def __init__(self, *, driver: uc.Chrome, urls: Iterable[str],
+                 config: BotConfig, gotify: GotifyClient, name: str = 'Udemy',
+                 replace: Callable[[uc.Chrome], uc.Chrome] | None = None) -> None:
         self.cache = Cache()
+        self.name = name
         self.driver = driver
+        # Quits a driver and returns a fresh one, so long runs can recycle their browser.
+        self.replace = replace
+        self.pages = 0
+        self.session: list[dict[str, Any]] = []
         self.logger = setup_logging()
         self.config = config
         self.urls = urls
         self.gotify = gotify
         self.patterns = {'enroll': 'payment/checkout',
                          'confirm': 'cart/success', 'free': 'cart/subscribe'}
+        self.states = {'Go to course': 'owned',
+                       'Buy now': 'paid', 'Enroll now': 'free'}
+        self.backoff = Backoff(base=config.backoff_base, cap=config.backoff_cap)
+        self.timer = StageTimer()
+
+    def pause(self, attempt: int) -> None:
+        """Back off after a failed attempt unless it was the last one."""
+        if attempt + 1 >= self.config.retries:
+            return
+        with self.timer.stage('backoff'):
+            self.backoff.sleep(attempt)
 
     def enter_email(self, *, wait: WebDriverWait, email: str) -> True:
         """Enter email into login form."""
@@ -51,8 +85,7 @@ class Udemy:
                     self.config.retries,
                     e
                 )
-                time.sleep(random.uniform(
-                    self.config.timeout/2, self.config.timeout))
+                self.pause(retry)
         return False
 
     def click_login_btn(self, wait: WebDriverWait) -> bool:
@@ -72,9 +105,7 @@ class Udemy:
                     self.config.retries,
                     e
                 )
-                time.sleep(random.uniform(
-                    self.config.timeout/2, self.config.timeout
-                ))
+                self.pause(retry)
         return False
 
     def click_purple_button(self, *, text: str, wait: WebDriverWait) -> bool:
@@ -97,9 +128,7 @@ class Udemy:
                     self.config.retries,
                     e
                 )
-                time.sleep(random.uniform(
-                    self.config.timeout/2, self.config.timeout
-                ))
+                self.pause(retry)
         return False
 
     def enter_code(self, *, wait: WebDriverWait, code: str) -> True:
@@ -112,7 +141,7 @@ class Udemy:
                 container.click()
                 code_input = wait.until(
                     EC.visibility_of_element_located(
-                        (By.CSS_SELECTOR, 'input.ud-text-input.ud-text-input-medium.ud-text-sm.ud-compact-form-control'))
+                        (By.CSS_SELECTOR, CODE_INPUT_SELECTOR))
                 )
                 code_input.clear()
                 code_input.send_keys(code)
@@ -126,10 +155,32 @@ class Udemy:
                     self.config.retries,
                     e
                 )
-                time.sleep(random.uniform(
-                    self.config.timeout/2, self.config.timeout))
+                self.pause(retry)
         return False
 
+    def await_code(self, *, wait: WebDriverWait, gmail_client: GmailClient,
+                   previous_code: str | None) -> str | None:
+        """
+        Poll Gmail with backoff until a verification code newer than the previous one arrives.
+        Return None if none arrives in time, as the previous code is no longer valid.
+        """
+        try:
+            wait.until(EC.visibility_of_element_located(
+                (By.CSS_SELECTOR, CODE_INPUT_SELECTOR)))
+        except TimeoutException:
+            self.logger.warning('Verification code input did not appear.')
+        deadline: float = time.monotonic() + self.config.timeout * self.config.retries
+        attempt: int = 0
+        with self.timer.stage('verification'):
+            while True:
+                code: str | None = gmail_client.get_verification_code()
+                if code and code != previous_code:
+                    return code
+                if time.monotonic() >= deadline:
+                    return None
+                self.backoff.sleep(attempt)
+                attempt += 1
+
     def login(self, email: str) -> None:
         """Log into Udemy account."""
         self.driver.get('https://www.udemy.com/')
@@ -151,6 +202,10 @@ class Udemy:
             )
             raise SystemExit('Exiting...')
 
+        gmail_client: GmailClient = GmailClient(
+            credentials_filename=Path('credentials.json')
+        )
+        previous_code: str | None = gmail_client.get_verification_code()
         if not self.click_purple_button(text='Continue', wait=wait):
             self.logger.error('Failed to click Continue button.')
             self.gotify.create_message(
@@ -160,11 +215,8 @@ class Udemy:
             raise SystemExit('Exiting...')
 
         self.logger.info('Clicked Continue button successfully.')
-        gmail_client: GmailClient = GmailClient(
-            credentials_filename=Path('credentials.json')
-        )
-        time.sleep(self.config.timeout)
-        code: str = gmail_client.get_verification_code()
+        code: str | None = self.await_code(
+            wait=wait, gmail_client=gmail_client, previous_code=previous_code)
         if not code:
             self.logger.error(
                 'Failed to retrieve verification code from email.')
@@ -183,6 +235,7 @@ class Udemy:
             raise SystemExit('Exiting...')
 
         self.logger.info('Entered verification code successfully.')
+        login_url: str = self.driver.current_url
         if not self.click_purple_button(text='Log in', wait=wait):
             self.logger.error('Failed to click final Log in button.')
             self.gotify.create_message(
@@ -190,15 +243,21 @@ class Udemy:
                 message='Failed to click final Log in button on Udemy.'
             )
             raise SystemExit('Exiting...')
-        time.sleep(self.config.timeout)
+        try:
+            wait.until(EC.url_changes(login_url))
+        except TimeoutException:
+            self.logger.error('Login page did not redirect after %ds.',
+                              self.config.timeout)
+            self.gotify.create_message(
+                title='Udemy Login Failed',
+                message='Udemy login page did not redirect after entering the verification code.'
+            )
+            raise SystemExit('Exiting...')
         self.logger.info('Logged into Udemy successfully.')
 
     def get_first_button(self, text: str) -> uc.WebElement | None:
         """Get the first enroll button that is clickable."""
-        button_xpath: str = (
-            "//button[(@data-purpose='buy-now-button' or @data-purpose='buy-this-course-button')"
-            f" and (contains(., '{text}'))]"
-        )
+        button_xpath: str = f"{BUY_BUTTON_XPATH}[contains(., '{text}')]"
         wait: WebDriverWait = WebDriverWait(
             self.driver, timeout=self.config.timeout)
         buttons: list[uc.WebElement] = wait.until(lambda d: d.find_elements(
@@ -220,22 +279,29 @@ class Udemy:
         )))
         return confirm_button
 
-    def is_owned(self) -> bool:
-        """Return a flag indicating whether a course is owned."""
-        try:
-            _button: uc.WebElement | None = self.get_first_button(
-                text='Go to course')
-            return True
-        except WebDriverException:
-            return False
+    def find_state(self, driver: uc.Chrome) -> str | bool:
+        """Return state of the first recognized buy button, or False if none is rendered yet."""
+        labels: list[str] = []
+        for button in driver.find_elements(By.XPATH, BUY_BUTTON_XPATH):
+            try:
+                if button.is_displayed():
+                    labels.append(button.text)
+            except StaleElementReferenceException:
+                continue
+        for text, state in self.states.items():
+            if any(text in label for label in labels):
+                return state
+        return False
 
-    def is_paid(self) -> bool:
-        """Return a flag whether course is paid."""
+    def classify(self) -> str:
+        """Return whether a course is owned, paid, free or unavailable in a single wait."""
+        wait: WebDriverWait = WebDriverWait(
+            self.driver, timeout=self.config.timeout,
+            ignored_exceptions=(StaleElementReferenceException,))
         try:
-            _button: uc.WebElement = self.get_first_button(text='Buy now')
-            return True
-        except WebDriverException:
-            return False
+            return wait.until(self.find_state)
+        except TimeoutException:
+            return 'unavailable'
 
     def enroll(self) -> bool:
         """Scan for first 'Enroll now' button and click on it."""
@@ -246,22 +312,19 @@ class Udemy:
                 enroll_button.click()
                 wait: WebDriverWait = WebDriverWait(
                     self.driver, timeout=self.config.timeout)
-                wait.until(
-                    EC.url_contains(self.patterns['enroll'])
-                )
+                wait.until(EC.any_of(
+                    EC.url_contains(self.patterns['enroll']),
+                    EC.url_contains(self.patterns['free'])
+                ))
                 self.logger.info('Attempt %d/%d succeeded!',
                                  attempt+1,
                                  self.config.retries)
-                time.sleep(random.uniform(
-                    self.config.timeout/2, self.config.timeout))
                 return True
             except WebDriverException:
                 self.logger.warning('Attempt %d/%d failed.',
                                     attempt+1,
                                     self.config.retries)
-                time.sleep(random.uniform(
-                    self.config.timeout/2, self.config.timeout))
-                continue
+                self.pause(attempt)
         return False
 
     def confirm(self) -> bool:
@@ -283,31 +346,59 @@ class Udemy:
                 self.logger.warning('Attempt %d/%d failed.',
                                     attempt+1,
                                     self.config.retries)
-                time.sleep(random.uniform(
-                    self.config.timeout/2, self.config.timeout))
-                continue
+                self.pause(attempt)
         return False
 
-    def summarize_stats(self, courses: dict[str, list[str]]) -> None:
-        """Summarize enrollment statistics."""
+    def timed(self, stage: str, action: Callable[[], bool]) -> bool:
+        """Run web action and account its duration to the given stage."""
+        with self.timer.stage(stage):
+            return action()
+
+    def report(self, courses: dict[str, list[str]]) -> None:
+        """Log outcomes and stage timings of this worker."""
+        self.logger.info(
+            '%s finished: %d enrolled, %d owned, %d paid, %d expired, %d known.',
+            self.name, len(courses['enrolled']), len(courses['owned']),
+            len(courses['paid']), len(courses['expired']), len(courses['known'])
+        )
+        for stage, duration, count in self.timer.summary():
+            self.logger.info('%s spent %.1fs in %s stage over %d calls.',
+                             self.name, duration, stage, count)
+
+    def summarize_stats(self, results: list[dict[str, list[str]]]) -> None:
+        """Summarize enrollment statistics aggregated across workers."""
+        courses: dict[str, list[str]] = {}
+        for result in results:
+            for outcome, slugs in result.items():
+                courses.setdefault(outcome, []).extend(slugs)
         self.logger.info(
             'Encountered %d already owned courses.',
-            len(courses['owned'])
+            len(courses.get('owned', []))
         )
         self.logger.info(
             'Encountered %d paid courses.',
-            len(courses['paid'])
+            len(courses.get('paid', []))
+        )
+        self.logger.info(
+            'Encountered %d courses with expired coupons.',
+            len(courses.get('expired', []))
         )
         self.logger.info(
-            'Enrolled into %d free courses.',
-            len(courses['enrolled'])
+            'Skipped %d courses settled by previous runs.',
+            len(courses.get('known', []))
+        )
+        self.logger.info(
+            'Enrolled into %d free courses across %d workers.',
+            len(courses.get('enrolled', [])), len(results)
         )
         self.gotify.create_message(
             title='Udemy Enrollment Summary',
             message=(
-                f"Enrolled: {len(courses['enrolled'])}\n"
-                f"Owned: {len(courses['owned'])}\n"
-                f"Paid: {len(courses['paid'])}\n"
+                f"Enrolled: {len(courses.get('enrolled', []))}\n"
+                f"Owned: {len(courses.get('owned', []))}\n"
+                f"Paid: {len(courses.get('paid', []))}\n"
+                f"Expired: {len(courses.get('expired', []))}\n"
+                f"Known: {len(courses.get('known', []))}\n"
             )
         )
 
@@ -321,62 +412,187 @@ class Udemy:
         course_slug: str = url_parts[4]
         return course_slug
 
-    def run(self, email: str) -> None:
-        """Orchestrate automatic enrollment into Udemy courses."""
-        self.logger.info('Udemy bot starting...')
-        courses: dict[str, list[str]] = {
-            'owned': [],
-            'paid': [],
-            'enrolled': []
-        }
-        self.login(email)
-        for udemy_url in self.urls:
-            course_slug: str | None = self.get_course_slug(udemy_url)
-            if course_slug in courses['enrolled'] + courses['owned']:
-                self.logger.info(
-                    '%s is already owned. Skipping...', course_slug
-                )
-                continue
-            self.logger.info('Visiting %s', udemy_url)
-            self.driver.get(udemy_url)
+    def get_coupon_code(self, udemy_url: str) -> str | None:
+        """Extract and return coupon code from Udemy URL."""
+        params: dict[str, list[str]] = parse_qs(urlparse(udemy_url).query)
+        return params.get('couponCode', [None])[0]
+
+    def is_settled(self, *, course_slug: str, coupon: str | None) -> bool:
+        """Return a flag indicating whether a previous visit already settled the course."""
+        outcome: tuple[str, str | None] | None = self.cache.get_outcome(
+            course_slug)
+        if outcome is None:
+            return False
+        status, known_coupon = outcome
+        if status in ('owned', 'enrolled'):
+            return True
+        return known_coupon == coupon
+
+    def record(self, *, courses: dict[str, list[str]], udemy_url: str,
+               course_slug: str | None, outcome: str, coupon: str | None) -> None:
+        """
+        Count outcome of the current run, persist it in the course index and mark the link
+        processed. Failed enrollments are not recorded, so their links stay pending.
+        """
+        courses[outcome].append(course_slug)
+        self.cache.append_jsonl(filename='udemy.jsonl', url=udemy_url)
+        if course_slug:
+            self.cache.set_outcome(
+                slug=course_slug, outcome=outcome, coupon=coupon)
+
+    def export_session(self) -> list[dict[str, Any]]:
+        """Return cookies of the logged-in session for other workers."""
+        return self.driver.get_cookies()
+
+    def import_session(self, cookies: list[dict[str, Any]]) -> None:
+        """Reuse a session exported by a logged-in worker instead of logging in again."""
+        self.driver.get('https://www.udemy.com/')
+        for cookie in cookies:
+            try:
+                self.driver.add_cookie(
+                    {key: value for key, value in cookie.items() if key in COOKIE_KEYS})
+            except WebDriverException as e:
+                self.logger.debug('Failed to import cookie %s: %s',
+                                  cookie.get('name'), e)
+        self.driver.refresh()
+        self.logger.info('%s imported %d session cookies.',
+                         self.name, len(cookies))
+
+    def is_logged_in(self) -> bool:
+        """Return a flag indicating whether the browser already holds a Udemy session."""
+        self.driver.get('https://www.udemy.com/')
+        return self.driver.get_cookie(SESSION_COOKIE) is not None
+
+    def start(self, *, email: str | None = None,
+              cookies: list[dict[str, Any]] | None = None) -> None:
+        """Log into Udemy with email or with cookies exported by another worker."""
+        with self.timer.stage('login'):
+            if cookies is not None:
+                self.import_session(cookies)
+            elif self.is_logged_in():
+                self.logger.info('%s reuses the session of the browser. Skipping login...',
+                                 self.name)
+            elif email:
+                self.login(email)
+        self.session = self.export_session()
+
+    def recycle_reason(self) -> str | None:
+        """Return why the browser should be replaced by a fresh one, if it should."""
+        if not is_alive(self.driver):
+            return 'it stopped responding'
+        if self.config.max_pages and self.pages >= self.config.max_pages:
+            return f'it loaded {self.pages} pages'
+        if self.config.max_memory and \
+                (memory := driver_memory(self.driver)) > self.config.max_memory:
+            return f'it uses {memory} MB'
+        return None
+
+    def recycle(self, reason: str) -> None:
+        """Replace the browser and carry the logged-in session over to the new one."""
+        self.logger.info('%s is replacing its browser because %s.', self.name, reason)
+        if is_alive(self.driver):
+            self.session = self.export_session()
+        self.driver = self.replace(self.driver)
+        self.pages = 0
+        self.import_session(self.session)
+
+    def maintain(self) -> None:
+        """Recycle the browser before the next course if it crashed or grew too much."""
+        if self.replace is None:
+            return
+        reason: str | None = self.recycle_reason()
+        if reason is not None:
+            self.recycle(reason)
+
+    def visit(self, *, udemy_url: str, courses: dict[str, list[str]]) -> None:
+        """Visit a Udemy link, enroll into the course if it is free and record the outcome."""
+        course_slug: str | None = self.get_course_slug(udemy_url)
+        coupon: str | None = self.get_coupon_code(udemy_url)
+        if course_slug and self.is_settled(course_slug=course_slug, coupon=coupon):
+            self.logger.info(
+                '%s was settled by a previous visit. Skipping...', course_slug
+            )
+            courses['known'].append(course_slug)
             self.cache.append_jsonl(
                 filename='udemy.jsonl', url=udemy_url)
-            course_name: str = self.driver.title.removesuffix(' | Udemy')
-            if self.is_owned():
-                self.logger.info('%s is owned. Skipping...', course_name)
-                courses['owned'].append(course_slug)
-            elif self.is_paid():
-                self.logger.info('%s is paid. Skipping...', course_name)
-                courses['paid'].append(course_slug)
-            elif self.enroll():
-                self.logger.info('Enrolling into %s', course_name)
-                if self.patterns['free'] in self.driver.current_url:
-                    self.logger.info('Successfully enrolled into %s',
-                                     course_name)
-                    self.gotify.create_message(
-                        title='Udemy Enrollment Successful',
-                        message=f'Enrolled into {course_name}',
-                    )
-                    courses['enrolled'].append(course_slug)
-                    continue
-                if self.confirm():
-                    self.logger.info('Successfully enrolled into %s.',
-                                     course_name)
-                    self.gotify.create_message(
-                        title='Udemy Enrollment Successful',
-                        message=f'Enrolled into {course_name}',
-                    )
-                    courses['enrolled'].append(course_slug)
-                else:
-                    self.logger.info('Failed to enroll into %s', course_name)
-                    self.gotify.create_message(
-                        title='Udemy Enrollment Failed',
-                        message=f'Failed to enroll into {course_name}'
-                    )
+            return
+        self.logger.info('Visiting %s', udemy_url)
+        with self.timer.stage('load'):
+            self.driver.get(udemy_url)
+        self.pages += 1
+        course_name: str = self.driver.title.removesuffix(' | Udemy')
+        with self.timer.stage('classify'):
+            state: str = self.classify()
+        if state == 'owned':
+            self.logger.info('%s is owned. Skipping...', course_name)
+            self.record(courses=courses, udemy_url=udemy_url, course_slug=course_slug,
+                        outcome='owned', coupon=coupon)
+        elif state == 'paid':
+            self.logger.info('%s is paid. Skipping...', course_name)
+            self.record(courses=courses, udemy_url=udemy_url, course_slug=course_slug,
+                        outcome='paid', coupon=coupon)
+        elif state == 'free' and self.timed('enroll', self.enroll):
+            self.logger.info('Enrolling into %s', course_name)
+            if self.patterns['free'] in self.driver.current_url:
+                self.logger.info('Successfully enrolled into %s',
+                                 course_name)
+                self.gotify.create_message(
+                    title='Udemy Enrollment Successful',
+                    message=f'Enrolled into {course_name}',
+                )
+                self.record(courses=courses, udemy_url=udemy_url, course_slug=course_slug,
+                            outcome='enrolled', coupon=coupon)
+                return
+            if self.timed('confirm', self.confirm):
+                self.logger.info('Successfully enrolled into %s.',
+                                 course_name)
+                self.gotify.create_message(
+                    title='Udemy Enrollment Successful',
+                    message=f'Enrolled into {course_name}',
+                )
+                self.record(courses=courses, udemy_url=udemy_url, course_slug=course_slug,
+                            outcome='enrolled', coupon=coupon)
             else:
-                self.logger.info('Course is unavailable. Skipping...')
+                self.logger.info('Failed to enroll into %s', course_name)
                 self.gotify.create_message(
                     title='Udemy Enrollment Failed',
                     message=f'Failed to enroll into {course_name}'
                 )
-        self.summarize_stats(courses)
+        elif state == 'free':
+            self.logger.info('Failed to enroll into %s', course_name)
+            self.gotify.create_message(
+                title='Udemy Enrollment Failed',
+                message=f'Failed to enroll into {course_name}'
+            )
+        else:
+            self.logger.info('Course is unavailable. Skipping...')
+            self.record(courses=courses, udemy_url=udemy_url, course_slug=course_slug,
+                        outcome='expired', coupon=coupon)
+            self.gotify.create_message(
+                title='Udemy Enrollment Failed',
+                message=f'Failed to enroll into {course_name}'
+            )
+
+    def run(self) -> dict[str, list[str]]:
+        """Orchestrate automatic enrollment into Udemy courses and return their outcomes."""
+        self.logger.info('%s starting...', self.name)
+        courses: dict[str, list[str]] = {
+            'owned': [],
+            'paid': [],
+            'expired': [],
+            'enrolled': [],
+            'known': []
+        }
+        for udemy_url in self.urls:
+            self.maintain()
+            try:
+                self.visit(udemy_url=udemy_url, courses=courses)
+            except BROWSER_ERRORS as e:
+                if self.replace is None or is_alive(self.driver):
+                    raise
+                self.logger.warning('%s browser crashed while visiting %s: %r',
+                                    self.name, udemy_url, e)
+                self.recycle('it crashed')
+                self.visit(udemy_url=udemy_url, courses=courses)
+        self.report(courses)
+        return courses
@@ -2,31 +2,42 @@
 Parse Udemy links with coupons from cache, automate course enrollment,
 scrape middleman links, get new Udemy links with coupons, and write them back to cache.
 """
+import asyncio
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
 from logging import Logger
-from typing import Any
+from queue import Queue
+from threading import Thread
+from typing import Any, Iterable, Iterator
 
 import undetected_chromedriver as uc
+from prawcore.exceptions import PrawcoreException
+from selenium.common.exceptions import WebDriverException
 
-from bot.coursecouponz import CourseCouponz
-from bot.coursetreat import CourseTreat
-from bot.easy_learning import EasyLearning
-from bot.freewebcart import Freewebcart
-from bot.idownloadcoupon import IDownloadCoupon
-from bot.invent_high import InventHigh
-from bot.line51 import Line51
-from bot.real_discount import RealDiscount
-from bot.webhelperapp import WebHelperApp
+from bot.registry import REGISTRY
+from bot.spider import AsyncSpider, BaseSpider
 from bot.udemy import Udemy
 from client.get_refresh_token import get_refresh_token
 from client.gotify import GotifyClient
-from client.reddit import RedditClient
+from client.http import HttpClient
+from client.reddit import Post, RedditClient, Watermark
 from utils.cache import Cache
+from utils.timing import Backoff
+from utils.urls import UDEMY
 from config.bot import BotConfig, SpiderConfig
+from config.http import HttpConfig
 from config.reddit import RedditConfig, SubredditConfig
 from config.settings import Settings
 from web.brave import Brave
+from web.browser import BrowserPool, DriverPool, TabPool
 from web.google_chrome import GoogleChrome
+from web.memory import MemoryGovernor
+
+# Seconds of the first and the longest wait before reconnecting to the subreddit stream in watch mode.
+STREAM_BACKOFF_BASE: float = 5.0
+STREAM_BACKOFF_CAP: float = 300.0
+# Times the posts of a failed batch are retried along with the next batch before being dropped.
+STREAM_BATCH_RETRIES: int = 3
 
 
 class Udemate:
@@ -37,13 +48,38 @@ class Udemate:
             self.browser = Brave(
                 major_version=settings.browser_major_version,
                 user_data_dir=settings.user_data_dir,
+                page_load_strategy=settings.page_load_strategy,
+                blocked_urls=settings.blocked_urls,
+                debugger_address=settings.debugger_address,
+                scrape_debugger_address=settings.scrape_debugger_address,
                 logger=logger)
         elif 'chrome' in settings.user_data_dir.lower():
             self.browser = GoogleChrome(
                 major_version=settings.browser_major_version,
                 user_data_dir=settings.user_data_dir,
+                page_load_strategy=settings.page_load_strategy,
+                blocked_urls=settings.blocked_urls,
+                debugger_address=settings.debugger_address,
+                scrape_debugger_address=settings.scrape_debugger_address,
                 logger=logger)
         self.cache = Cache()
+        self.cache.import_legacy()
+        self.governor = MemoryGovernor(budget=settings.browser_memory_budget, logger=logger)
+        self.pools: dict[str, BrowserPool] = {}
+        self.http = HttpClient(
+            HttpConfig(
+                http2=settings.http2,
+                dns_ttl=settings.dns_cache_ttl,
+                keepalive_expiry=settings.http_keepalive_expiry,
+                default_limit=settings.http_pool_limit,
+                limits={
+                    host: max(getattr(settings, f'{spider.prefix}_threads'),
+                              settings.max_concurrency)
+                    for host, spider in REGISTRY.items()
+                }
+            )
+        )
+        self.loop = asyncio.new_event_loop()
         self.config = settings
         self.gotify = gotify
         self.logger = logger
@@ -70,181 +106,331 @@ class Udemate:
         ]
         if self.config.reddit_password:
             reddit_client: RedditClient = RedditClient(
-                config=reddit_config, subreddit_configs=subreddit_configs)
+                config=reddit_config, subreddit_configs=subreddit_configs,
+                middlemen=frozenset(REGISTRY))
         else:
             refresh_token: str = get_refresh_token(reddit_config)
             reddit_client: RedditClient = RedditClient(
                 config=reddit_config, subreddit_configs=subreddit_configs,
-                refresh_token=refresh_token
+                middlemen=frozenset(REGISTRY), refresh_token=refresh_token
             )
         return reddit_client
 
-    def collect_middleman_links(self) -> dict[str, set[str]]:
-        """Collect middleman links from Reddit."""
-        reddit_client: RedditClient = self.setup_reddit_client()
-        reddit_client.populate_submissions()
-        middlemen: list[str] = reddit_client.get_middlemen()
-        middleman_urls: dict[
-            str,
-            list[str]
-        ] = reddit_client.get_middleman_urls(middlemen)
-        for middleman in middlemen:
+    def cache_middleman_links(self, reddit_client: RedditClient) -> dict[str, list[str]]:
+        """Cache middleman links of the fetched Reddit posts."""
+        middleman_urls: dict[str, list[str]] = reddit_client.get_middleman_urls()
+        for middleman, urls in middleman_urls.items():
+            if middleman != UDEMY and middleman not in REGISTRY:
+                self.logger.warning('No spider handles %s. Skipping %d links...',
+                                    middleman, len(urls))
+                continue
             self.cache.write_json(
-                data=middleman_urls[middleman],
+                data=urls,
                 filename=f'{middleman}.json'
             )
         return middleman_urls
 
-    def initialize_spiders(self, middleman_urls: dict[str, set[str]]) -> dict[str, Any]:
-        """Initialize spiders for each middleman."""
-        spiders: dict[str, Any] = {}
+    def setup_pool(self, *, middleman: str, size: int) -> BrowserPool:
+        """Return the driver pool of a browser spider, or the shared tab pool."""
+        # Spiders attached to a running browser share it through tabs.
+        shared: bool = self.config.shared_browser or bool(self.config.scrape_debugger_address)
+        key: str = 'shared' if shared else middleman
+        if key not in self.pools:
+            limits: dict[str, Any] = {'governor': self.governor,
+                                      'max_pages': self.config.driver_max_pages,
+                                      'max_memory': self.config.driver_max_memory}
+            self.pools[key] = TabPool(browser=self.browser, **limits) if shared \
+                else DriverPool(browser=self.browser, size=size, **limits)
+        return self.pools[key]
+
+    def close_pools(self) -> None:
+        """Quit the headless browsers of every pool."""
+        for pool in self.pools.values():
+            pool.close()
+        self.pools.clear()
+
+    def initialize_spiders(self, middleman_urls: dict[str, list[str]],
+                           queue: Queue[str | None] | None = None) -> dict[str, BaseSpider]:
+        """Initialize spiders for the middlemen that have links to resolve."""
+        spiders: dict[str, BaseSpider] = {}
         for middleman, urls in middleman_urls.items():
-            match middleman:
-                case 'coursecouponz':
-                    spiders[middleman] = CourseCouponz(
-                        urls=urls,
-                        gotify=self.gotify,
-                        config=SpiderConfig(
-                            retries=self.config.coursecouponz_retries,
-                            threads=self.config.coursecouponz_threads,
-                            timeout=self.config.coursecouponz_timeout
-                        )
-                    )
-                case 'coursetreat':
-                    spiders[middleman] = CourseTreat(
-                        urls=urls,
-                        gotify=self.gotify,
-                        config=SpiderConfig(
-                            retries=self.config.coursetreat_retries,
-                            threads=self.config.coursetreat_threads,
-                            timeout=self.config.coursetreat_timeout
-                        )
-                    )
-                case 'easylearn':
-                    spiders[middleman] = EasyLearning(
-                        urls=urls,
-                        gotify=self.gotify,
-                        config=SpiderConfig(
-                            retries=self.config.easylearn_retries,
-                            threads=self.config.easylearn_threads,
-                            timeout=self.config.easylearn_timeout
-                        )
-                    )
-                case 'freewebcart':
-                    headless_driver: uc.Chrome = self.browser.setup(
-                        headless=True)
-                    spiders[middleman] = Freewebcart(
-                        driver=headless_driver,
-                        urls=urls,
-                        gotify=self.gotify,
-                        config=SpiderConfig(
-                            retries=self.config.freewebcart_retries,
-                            threads=self.config.freewebcart_threads,
-                            timeout=self.config.freewebcart_timeout
-                        )
-                    )
-                case 'idownloadcoupon':
-                    spiders[middleman] = IDownloadCoupon(
-                        urls=urls,
-                        gotify=self.gotify,
-                        config=SpiderConfig(
-                            retries=self.config.idownloadcoupon_retries,
-                            threads=self.config.idownloadcoupon_threads,
-                            timeout=self.config.idownloadcoupon_timeout
-                        )
-                    )
-                case 'inventhigh':
-                    spiders[middleman] = InventHigh(
-                        urls=urls,
-                        gotify=self.gotify,
-                        config=SpiderConfig(
-                            retries=self.config.inventhigh_retries,
-                            threads=self.config.inventhigh_threads,
-                            timeout=self.config.inventhigh_timeout
-                        )
-                    )
-                case 'line51':
-                    headless_driver: uc.Chrome = self.browser.setup(
-                        headless=True)
-                    spiders[middleman] = Line51(
-                        driver=headless_driver,
-                        urls=urls,
-                        gotify=self.gotify,
-                        config=SpiderConfig(
-                            retries=self.config.line51_retries,
-                            threads=self.config.line51_threads,
-                            timeout=self.config.line51_timeout
-                        )
-                    )
-                case 'real':
-                    headless_driver: uc.Chrome = self.browser.setup(
-                        headless=True)
-                    spiders[middleman] = RealDiscount(
-                        driver=headless_driver,
-                        urls=urls,
-                        gotify=self.gotify,
-                        config=SpiderConfig(
-                            retries=self.config.real_discount_retries,
-                            threads=self.config.real_discount_threads,
-                            timeout=self.config.real_discount_timeout
-                        )
-                    )
-                case 'webhelperapp':
-                    spiders[middleman] = WebHelperApp(
-                        urls=urls,
-                        gotify=self.gotify,
-                        config=SpiderConfig(
-                            retries=self.config.webhelperapp_retries,
-                            threads=self.config.webhelperapp_threads,
-                            timeout=self.config.webhelperapp_timeout
-                        )
-                    )
+            spider_class: type[BaseSpider] | None = REGISTRY.get(middleman)
+            if spider_class is None or not urls:
+                continue
+            kwargs: dict[str, Any] = {}
+            if spider_class.pooled:
+                kwargs['pool'] = self.setup_pool(
+                    middleman=middleman,
+                    size=getattr(self.config, f'{spider_class.prefix}_threads'))
+            spiders[middleman] = spider_class(
+                urls=urls,
+                http=self.http,
+                gotify=self.gotify,
+                queue=queue,
+                config=SpiderConfig(
+                    retries=getattr(self.config, f'{spider_class.prefix}_retries'),
+                    threads=getattr(self.config, f'{spider_class.prefix}_threads'),
+                    max_threads=max(getattr(self.config, f'{spider_class.prefix}_threads'),
+                                    self.config.max_concurrency),
+                    timeout=getattr(self.config, f'{spider_class.prefix}_timeout'),
+                    cache_ttl=self.config.resolution_ttl,
+                    stream=self.config.stream_extraction,
+                    drain=self.config.stream_drain_bytes,
+                    parser=self.config.html_parser,
+                    bulk=self.config.wordpress_bulk
+                ),
+                **kwargs
+            )
         return spiders
 
-    def scrape(self) -> list[str]:
+    async def crawl(self, spiders: list[AsyncSpider]) -> list[str]:
+        """Run asynchronous spiders concurrently on the shared event loop."""
+        results: list[list[str]] = await asyncio.gather(
+            *(spider.crawl() for spider in spiders)
+        )
+        return [udemy_url for result in results for udemy_url in result]
+
+    def resolve(self, middleman_urls: dict[str, list[str]],
+                queue: Queue[str | None] | None = None) -> list[str]:
+        """Return Udemy links resolved from middleman links by the spiders."""
+        # Direct Udemy links need no spider and go straight to enrollment.
+        udemy_urls: list[str] = list(middleman_urls.get(UDEMY, []))
+        if queue is not None:
+            for udemy_url in udemy_urls:
+                queue.put(udemy_url)
+        spiders: dict[str, BaseSpider] = self.initialize_spiders(
+            middleman_urls, queue)
+        async_spiders: list[AsyncSpider] = [
+            spider for spider in spiders.values() if isinstance(spider, AsyncSpider)
+        ]
+        udemy_urls.extend(self.loop.run_until_complete(self.crawl(async_spiders)))
+        self.http.log_stats()
+        return sorted(set(udemy_urls))
+
+    def scrape(self, queue: Queue[str | None] | None = None) -> list[str]:
         """Fetch collection of Udemy links with coupons using middleman spiders."""
-        middleman_urls: dict[str, set[str]] = self.collect_middleman_links()
-        udemy_urls: list[str] = []
-        spiders: dict[str, Any] = self.initialize_spiders(middleman_urls)
-        with ThreadPoolExecutor(max_workers=min(8, len(spiders))) as executor:
-            futures = {executor.submit(
-                spider.run): middleman for middleman, spider in spiders.items()}
-            for future in as_completed(futures):
-                __name: str = futures[future]
-                result: list[str] = future.result()
-                udemy_urls.extend(result)
-        udemy_urls = sorted(set(udemy_urls))
+        reddit_client: RedditClient = self.setup_reddit_client()
+        reddit_client.populate_submissions()
+        udemy_urls: list[str] = self.process(reddit_client=reddit_client, queue=queue)
+        self.close_pools()
         self.gotify.create_message(
             title='Scraping completed',
             message=f'Spiders scraped a total of {len(udemy_urls)} Udemy links.'
         )
         self.logger.info('Spiders scraped a total of %d Udemy links.',
                          len(udemy_urls))
-        self.cache.write_json(data=udemy_urls, filename='udemy.json')
         return udemy_urls
 
-    def autoenroll(self, udemy_urls: list[str]) -> None:
-        """Autoenroll into free Udemy courses using GUI browser."""
-        udemy_urls: list[str] = self.cache.filter_urls('udemy')
-        if not udemy_urls:
-            self.logger.info('No new Udemy links to process. Exiting...')
-            self.gotify.create_message(
-                title='No Udemy links found',
-                message='No new Udemy links found to process. Exiting...'
-            )
-            return
-        gui_driver: uc.Chrome = self.browser.setup(headless=False)
-        udemy: Udemy = Udemy(
-            driver=gui_driver,
+    def launch_gui(self, *, profile: bool = False) -> uc.Chrome:
+        """Launch a GUI browser for enrollment and count its memory towards the budget."""
+        with self.browser.setup_lock:
+            driver: uc.Chrome = self.browser.setup(headless=False, profile=profile)
+        self.governor.track(driver)
+        return driver
+
+    def quit_gui(self, driver: uc.Chrome) -> None:
+        """Quit a GUI browser, which may already have crashed."""
+        self.governor.untrack(driver)
+        try:
+            self.browser.quit(driver)
+        except (WebDriverException, OSError) as e:
+            self.logger.error('Failed to quit GUI browser: %r', e)
+
+    def replace_gui(self, driver: uc.Chrome) -> uc.Chrome:
+        """
+        Quit a crashed or bloated GUI browser and launch a fresh one in a throwaway profile,
+        or attach to the running browser again if the driver was attached to it.
+        """
+        attached: bool = driver in self.browser.attached
+        self.quit_gui(driver)
+        return self.launch_gui(profile=attached)
+
+    def setup_udemy(self, *, driver: uc.Chrome, urls: Iterable[str], name: str) -> Udemy:
+        """Return Udemy bot driving the given GUI browser."""
+        return Udemy(
+            driver=driver,
             config=BotConfig(
                 retries=self.config.udemy_retries,
-                timeout=self.config.udemy_timeout
+                timeout=self.config.udemy_timeout,
+                backoff_base=self.config.udemy_backoff_base,
+                backoff_cap=self.config.udemy_backoff_cap,
+                max_pages=self.config.driver_max_pages,
+                max_memory=self.config.driver_max_memory
             ),
-            urls=udemy_urls,
-            gotify=self.gotify
+            urls=urls,
+            gotify=self.gotify,
+            name=name,
+            replace=self.replace_gui
         )
-        udemy.run(email=self.config.udemy_email)
-        gui_driver.quit()
+
+    def feed(self, *, udemy_urls: Iterable[str], work: Queue[str | None], workers: int) -> None:
+        """Hand Udemy links to enrollment workers and stop each of them afterwards."""
+        try:
+            for udemy_url in udemy_urls:
+                work.put(udemy_url)
+        finally:
+            for _worker in range(workers):
+                work.put(None)
+
+    def enroll(self, udemy_urls: Iterable[str]) -> None:
+        """Enroll into Udemy courses using `udemy_threads` GUI browsers sharing one session."""
+        workers: int = max(1, self.config.udemy_threads)
+        work: Queue[str | None] = Queue()
+        bots: list[Udemy] = []
+        try:
+            leader: Udemy = self.setup_udemy(
+                driver=self.launch_gui(profile=True), urls=iter(work.get, None),
+                name='Udemy worker 1')
+            bots.append(leader)
+            leader.start(email=self.config.udemy_email)
+            if workers > 1:
+                cookies: list[dict[str, Any]] = leader.export_session()
+                for index in range(2, workers + 1):
+                    bot: Udemy = self.setup_udemy(
+                        driver=self.launch_gui(), urls=iter(work.get, None),
+                        name=f'Udemy worker {index}')
+                    bots.append(bot)
+                    bot.start(cookies=cookies)
+            feeder: Thread = Thread(target=self.feed, kwargs={
+                'udemy_urls': udemy_urls, 'work': work, 'workers': workers})
+            feeder.start()
+            results: list[dict[str, list[str]]] = []
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(bot.run): bot for bot in bots}
+                for future in as_completed(futures):
+                    try:
+                        results.append(future.result())
+                    except WebDriverException as e:
+                        self.logger.error('%s stopped: %s',
+                                          futures[future].name, e)
+            feeder.join()
+            leader.summarize_stats(results)
+        finally:
+            for bot in bots:
+                self.quit_gui(bot.driver)
+
+    def report_no_links(self) -> None:
+        """Log and notify that there are no Udemy links to process."""
+        self.logger.info('No new Udemy links to process. Exiting...')
+        self.gotify.create_message(
+            title='No Udemy links found',
+            message='No new Udemy links found to process. Exiting...'
+        )
+
+    def autoenroll(self, udemy_urls: list[str]) -> None:
+        """Autoenroll into free Udemy courses using GUI browser."""
+        udemy_urls: list[str] = self.cache.filter_urls('udemy', ttl=self.config.resolution_ttl)
+        if not udemy_urls:
+            self.report_no_links()
+            return
+        self.enroll(udemy_urls)
+
+    def drain(self, queue: Queue[str | None]) -> Iterator[str]:
+        """Yield unprocessed Udemy links from the pipeline until the spiders finish."""
+        processed: set[str] = set(self.cache.read_jsonl('udemy.jsonl'))
+        while (udemy_url := queue.get()) is not None:
+            if udemy_url in processed:
+                continue
+            processed.add(udemy_url)
+            yield udemy_url
+
+    def consume(self, queue: Queue[str | None]) -> None:
+        """Enroll into Udemy links from the pipeline as soon as they are resolved."""
+        udemy_urls: Iterator[str] = self.drain(queue)
+        try:
+            first_url: str | None = next(udemy_urls, None)
+            if first_url is None:
+                self.report_no_links()
+                return
+            self.enroll(chain([first_url], udemy_urls))
+        finally:
+            # Keep spiders from blocking on a full queue if enrollment stopped early.
+            for _udemy_url in udemy_urls:
+                pass
+
+    def stream(self) -> None:
+        """Scrape Udemy links and enroll into them concurrently."""
+        queue: Queue[str | None] = Queue(maxsize=self.config.pipeline_size)
+        consumer: Thread = Thread(target=self.consume, args=(queue,))
+        consumer.start()
+        try:
+            for udemy_url in self.cache.filter_urls('udemy', ttl=self.config.resolution_ttl):
+                queue.put(udemy_url)
+            self.scrape(queue)
+        finally:
+            queue.put(None)
+            consumer.join()
+
+    def process(self, *, reddit_client: RedditClient,
+                queue: Queue[str | None] | None = None) -> list[str]:
+        """
+        Resolve the middleman links of freshly fetched posts into the pipeline. Watermarks
+        advance only once the spiders finished, so posts of an interrupted run are fetched again.
+        """
+        middleman_urls: dict[str, list[str]] = self.cache_middleman_links(
+            reddit_client)
+        udemy_urls: list[str] = self.resolve(middleman_urls, queue)
+        self.cache.write_json(data=udemy_urls, filename='udemy.json')
+        reddit_client.commit_watermarks()
+        return udemy_urls
+
+    def process_batch(self, *, reddit_client: RedditClient, queue: Queue[str | None]) -> bool:
+        """
+        Process one batch of posts in watch mode and return a flag indicating whether it
+        succeeded. A failing batch is logged instead of raised, so a single bad post or a
+        locked database does not stop the daemon.
+        """
+        try:
+            self.process(reddit_client=reddit_client, queue=queue)
+        except Exception:
+            self.logger.exception('Failed to process %d Reddit posts.',
+                                  len(reddit_client.submissions))
+            return False
+        return True
+
+    def watch(self) -> None:
+        """Keep clients and browsers alive, resolving and enrolling links from new posts as they arrive."""
+        queue: Queue[str | None] = Queue(maxsize=self.config.pipeline_size)
+        consumer: Thread = Thread(target=self.consume, args=(queue,))
+        consumer.start()
+        backoff: Backoff = Backoff(base=STREAM_BACKOFF_BASE, cap=STREAM_BACKOFF_CAP)
+        try:
+            for udemy_url in self.cache.filter_urls('udemy', ttl=self.config.resolution_ttl):
+                queue.put(udemy_url)
+            reddit_client: RedditClient = self.setup_reddit_client()
+            # Watermarks of the last processed batch. Fetching advances them in memory, so they
+            # are rolled back when a batch fails, or the next commit would skip its posts.
+            committed: dict[str, Watermark] = dict(reddit_client.watermarks)
+            pending: list[Post] = []
+            failures: int = 0
+            reddit_client.populate_submissions()
+            fetched: Iterator[list[Post]] = iter([reddit_client.submissions])
+            attempt: int = 0
+            while True:
+                try:
+                    for posts in chain(fetched, reddit_client.stream()):
+                        self.logger.info('Received %d new Reddit posts.', len(posts))
+                        reddit_client.submissions = [*pending, *posts]
+                        if self.process_batch(reddit_client=reddit_client, queue=queue):
+                            committed = dict(reddit_client.watermarks)
+                            pending, failures = [], 0
+                        else:
+                            reddit_client.watermarks = dict(committed)
+                            pending, failures = reddit_client.submissions, failures + 1
+                            if failures > STREAM_BATCH_RETRIES:
+                                self.logger.error(
+                                    'Dropping %d Reddit posts after %d failed batches.',
+                                    len(pending), failures)
+                                pending, failures = [], 0
+                        attempt = 0
+                except PrawcoreException as e:
+                    self.logger.error('Reddit stream failed: %r. Reconnecting...', e)
+                    backoff.sleep(attempt)
+                    attempt += 1
+        finally:
+            self.close_pools()
+            queue.put(None)
+            consumer.join()
 
     def run(self, mode: str) -> None:
         """Run Udemate based on command-line arguments passed."""
@@ -253,8 +439,18 @@ class Udemate:
             message=f'Udemate is starting in {mode} mode.'
         )
         self.logger.info('Starting Udemate in %s mode...', mode)
-        udemy_urls: list[str] = []
-        if mode in ('headless', 'hybrid'):
-            udemy_urls: list[str] = self.scrape()
-        if mode in ('hybrid', 'gui'):
-            self.autoenroll(udemy_urls)
+        match mode:
+            case 'headless':
+                self.scrape()
+            case 'gui':
+                self.autoenroll([])
+            case 'hybrid':
+                self.stream()
+            case 'watch':
+                self.watch()
+        self.close()
+
+    def close(self) -> None:
+        """Close the shared HTTP client and event loop."""
+        self.loop.run_until_complete(self.http.aclose())
+        self.loop.close()
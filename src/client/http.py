@@ -0,0 +1,180 @@
+"""Share pooled keep-alive HTTP connections between middleman spiders."""
+import asyncio
+import importlib.util
+import socket
+import time
+from typing import Any, Iterable
+
+import httpcore
+import httpx
+
+from config.http import HttpConfig
+from utils.logger import setup_logging
+from utils.urls import get_label
+
+
+class HttpStats:
+    """Count requests, opened connections, and DNS cache lookups."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.connections = 0
+        self.dns_hits = 0
+        self.dns_misses = 0
+
+    @property
+    def reused(self) -> int:
+        """Return number of requests served over an already open connection."""
+        return max(0, self.requests - self.connections)
+
+    def as_dict(self) -> dict[str, int]:
+        """Return snapshot of the transport counters."""
+        return {
+            'requests': self.requests,
+            'new_connections': self.connections,
+            'reused_connections': self.reused,
+            'dns_hits': self.dns_hits,
+            'dns_misses': self.dns_misses
+        }
+
+
+class CachingBackend(httpcore.AsyncNetworkBackend):
+    """Resolve hostnames through an in-process DNS cache before opening TCP connections."""
+
+    def __init__(self, *, ttl: int, stats: HttpStats) -> None:
+        self.backend = httpcore.AnyIOBackend()
+        self.ttl = ttl
+        self.stats = stats
+        self.addresses: dict[tuple[str, int], tuple[list[str], float]] = {}
+
+    async def resolve(self, host: str, port: int) -> list[str]:
+        """Return cached IP addresses of host, resolving them once per TTL."""
+        cached: tuple[list[str], float] | None = self.addresses.get((host, port))
+        if cached and cached[1] > time.monotonic():
+            self.stats.dns_hits += 1
+            return cached[0]
+        self.stats.dns_misses += 1
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, port, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise httpcore.ConnectError(str(e)) from e
+        addresses: list[str] = list(dict.fromkeys(info[4][0] for info in infos))
+        self.addresses[(host, port)] = (addresses, time.monotonic() + self.ttl)
+        return addresses
+
+    async def connect_tcp(self, host: str, port: int, timeout: float | None = None,
+                          local_address: str | None = None,
+                          socket_options: Iterable | None = None) -> httpcore.AsyncNetworkStream:
+        """
+        Open a new TCP connection to the cached addresses of host, trying each one in turn
+        and preferring the address that connected last, e.g. IPv4 on hosts without IPv6.
+        """
+        addresses: list[str] = await self.resolve(host, port)
+        error: Exception | None = None
+        for address in list(addresses):
+            try:
+                stream: httpcore.AsyncNetworkStream = await self.backend.connect_tcp(
+                    address, port, timeout=timeout,
+                    local_address=local_address, socket_options=socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+                continue
+            if address != addresses[0]:
+                addresses.remove(address)
+                addresses.insert(0, address)
+            self.stats.connections += 1
+            return stream
+        self.addresses.pop((host, port), None)
+        raise error or httpcore.ConnectError(f'No addresses resolved for {host}')
+
+    async def connect_unix_socket(self, path: str, timeout: float | None = None,
+                                  socket_options: Iterable | None = None
+                                  ) -> httpcore.AsyncNetworkStream:
+        """Open a Unix socket connection."""
+        return await self.backend.connect_unix_socket(
+            path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        """Sleep without blocking the event loop."""
+        await self.backend.sleep(seconds)
+
+
+class HostTransport(httpx.AsyncBaseTransport):
+    """Route requests to keep-alive connection pools sized per middleman host."""
+
+    def __init__(self, *, config: HttpConfig, http2: bool, stats: HttpStats) -> None:
+        self.config = config
+        self.http2 = http2
+        self.stats = stats
+        self.backend = CachingBackend(ttl=config.dns_ttl, stats=stats)
+        self.ssl_context = httpx.create_ssl_context()
+        self.pools: dict[str, httpx.AsyncHTTPTransport] = {}
+
+    def get_pool(self, host: str) -> httpx.AsyncHTTPTransport:
+        """Return connection pool of host, sized by the limit of its middleman."""
+        if host not in self.pools:
+            limit: int = self.config.limits.get(
+                get_label(host), self.config.default_limit)
+            transport: httpx.AsyncHTTPTransport = httpx.AsyncHTTPTransport(
+                verify=self.ssl_context, http2=self.http2)
+            # HTTPX does not expose the network backend, so rebuild its pool on top of the DNS cache.
+            transport._pool = httpcore.AsyncConnectionPool(  # pylint: disable=protected-access
+                ssl_context=self.ssl_context,
+                max_connections=limit,
+                max_keepalive_connections=limit,
+                keepalive_expiry=self.config.keepalive_expiry,
+                http2=self.http2,
+                network_backend=self.backend
+            )
+            self.pools[host] = transport
+        return self.pools[host]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send request over the pool of its host, counting only requests that got a response."""
+        response: httpx.Response = await self.get_pool(
+            request.url.host).handle_async_request(request)
+        self.stats.requests += 1
+        return response
+
+    async def aclose(self) -> None:
+        """Close every connection pool."""
+        for pool in self.pools.values():
+            await pool.aclose()
+
+
+class HttpClient:
+    """Expose one process-wide pooled HTTP client to every spider."""
+
+    def __init__(self, config: HttpConfig) -> None:
+        self.logger = setup_logging()
+        http2: bool = config.http2
+        if http2 and importlib.util.find_spec('h2') is None:
+            self.logger.warning(
+                'HTTP/2 requested but the h2 package is not installed. Using HTTP/1.1.')
+            http2 = False
+        self.stats = HttpStats()
+        self.transport = HostTransport(
+            config=config, http2=http2, stats=self.stats)
+        self.client = httpx.AsyncClient(
+            transport=self.transport, follow_redirects=True)
+
+    def import_cookies(self, cookies: list[dict[str, Any]]) -> None:
+        """Add cookies exported from a browser, e.g. challenge clearance, to the client jar."""
+        for cookie in cookies:
+            self.client.cookies.set(cookie['name'], cookie['value'],
+                                    domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+
+    def log_stats(self) -> None:
+        """Log reused versus new connections and DNS cache usage."""
+        stats: dict[str, int] = self.stats.as_dict()
+        self.logger.info(
+            'HTTP transport served %d requests over %d new and %d reused connections '
+            '(DNS cache: %d hits, %d misses).',
+            stats['requests'], stats['new_connections'], stats['reused_connections'],
+            stats['dns_hits'], stats['dns_misses']
+        )
+
+    async def aclose(self) -> None:
+        """Close the client and its connection pools."""
+        await self.client.aclose()
@@ -3,6 +3,8 @@ Configure Reddit PRAW for r/udemyfreebies, r/udemyfreeebies, and r/udemyfreecour
 fetch posts on subreddit, and extract hostnames.
 """
 import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, NamedTuple
 from urllib.parse import urlparse
 
 import praw
@@ -11,7 +13,21 @@ from praw.models.reddit.submission import Submission
 from praw.models.reddit.subreddit import Subreddit
 
 from config.reddit import RedditConfig, SubredditConfig
+from utils.cache import Cache
 from utils.logger import setup_logging
+from utils.urls import UDEMY, bucket, clean_udemy_url, get_middleman, unwrap
+
+
+class Post(NamedTuple):
+    """Keep only the fields of a Reddit submission that carry middleman links."""
+    url: str
+    selftext: str
+
+
+class Watermark(NamedTuple):
+    """Identify the newest post ingested from a subreddit."""
+    fullname: str
+    created_utc: float
 
 
 class RedditClient:
@@ -22,59 +38,103 @@ class RedditClient:
     """
 
     def __init__(self, *, config: RedditConfig, subreddit_configs: list[SubredditConfig],
+                 middlemen: frozenset[str] = frozenset(),
                  refresh_token: str | None = None) -> None:
         self.config = config
         self.subreddit_configs = subreddit_configs
-        if refresh_token:
-            self.refresh_token = refresh_token
-            self.reddit = praw.Reddit(
-                client_id=config.client_id,
-                client_secret=config.client_secret,
-                user_agent=config.user_agent,
-                refresh_token=refresh_token
-            )
-        else:
-            self.reddit = praw.Reddit(
-                client_id=config.client_id,
-                client_secret=config.client_secret,
-                password=config.password,
-                user_agent=config.user_agent,
-                username=config.username
-            )
-        self.submissions: list[Submission] = []
+        # Middleman keys with a spider, whose links are fetched rather than decoded locally.
+        self.middlemen = middlemen
+        self.refresh_token = refresh_token
+        self.submissions: list[Post] = []
+        self.watermarks: dict[str, Watermark] = {}
+        self.cache = Cache()
         self.logger = setup_logging()
 
-    def populate_submissions(self) -> None:
-        """Fill the list of Reddit posts."""
+    def connect(self) -> praw.Reddit:
+        """Return a PRAW instance; PRAW is not thread-safe so each fetching thread gets its own."""
+        if self.refresh_token:
+            return praw.Reddit(
+                client_id=self.config.client_id,
+                client_secret=self.config.client_secret,
+                user_agent=self.config.user_agent,
+                refresh_token=self.refresh_token
+            )
+        return praw.Reddit(
+            client_id=self.config.client_id,
+            client_secret=self.config.client_secret,
+            password=self.config.password,
+            user_agent=self.config.user_agent,
+            username=self.config.username
+        )
+
+    def load_watermark(self, subreddit: str) -> Watermark | None:
+        """Return the newest watermark of a subreddit, committed or not."""
+        if subreddit in self.watermarks:
+            return self.watermarks[subreddit]
+        stored: tuple[str, float] | None = self.cache.get_watermark(subreddit)
+        return Watermark(*stored) if stored else None
+
+    def fetch(self, config: SubredditConfig) -> list[Post]:
+        """Return posts newer than the subreddit watermark, stopping pagination once it is reached."""
+        watermark: Watermark | None = self.load_watermark(config.name)
+        posts: list[Post] = []
         try:
-            subreddits: list[Subreddit] = [
-                self.reddit.subreddit(config.name) for config in self.subreddit_configs
-            ]
-            for i, subreddit in enumerate(subreddits):
-                for submission in subreddit.new(
-                        limit=self.subreddit_configs[i].limit
-                ):
-                    self.submissions.append(submission)
+            subreddit: Subreddit = self.connect().subreddit(config.name)
+            submission: Submission
+            for submission in subreddit.new(limit=config.limit):
+                if watermark and (submission.fullname == watermark.fullname or
+                                  submission.created_utc <= watermark.created_utc):
+                    break
+                if not posts:
+                    self.watermarks[config.name] = Watermark(
+                        submission.fullname, submission.created_utc)
+                posts.append(Post(submission.url, submission.selftext))
         except RequestException as e:
-            self.logger.error('Failed to fetch Reddit posts: %r', e)
+            self.logger.error('Failed to fetch posts from r/%s: %r',
+                              config.name, e)
+            self.watermarks.pop(config.name, None)
+            return []
+        self.logger.info('Fetched %d new posts from r/%s.',
+                         len(posts), config.name)
+        return posts
 
-    def get_middlemen(self) -> list[str]:
-        """Return list of detected middlemen hostnames."""
-        middlemen: list[str] = []
-        for submission in self.submissions:
-            result = urlparse(submission.url)
-            flag: bool = all(
-                [result.scheme, result.netloc]
-            )
-            if not flag:
+    def populate_submissions(self) -> None:
+        """Fill the list of Reddit posts newer than the stored watermarks, one thread per subreddit."""
+        configs: list[SubredditConfig] = [
+            config for config in self.subreddit_configs if config.limit
+        ]
+        with ThreadPoolExecutor(max_workers=max(1, len(configs))) as executor:
+            for posts in executor.map(self.fetch, configs):
+                self.submissions.extend(posts)
+
+    def stream(self) -> Iterator[list[Post]]:
+        """Yield batches of posts from the combined subreddit stream whenever it runs dry."""
+        names: list[str] = [
+            config.name for config in self.subreddit_configs if config.limit]
+        watermarks: dict[str, Watermark | None] = {
+            name: self.load_watermark(name) for name in names}
+        subreddit: Subreddit = self.connect().subreddit('+'.join(names))
+        batch: list[Post] = []
+        submission: Submission | None
+        for submission in subreddit.stream.submissions(pause_after=0):
+            if submission is None:
+                if batch:
+                    yield batch
+                    batch = []
+                continue
+            name: str = submission.subreddit.display_name.lower()
+            watermark: Watermark | None = watermarks.get(name)
+            if watermark and submission.created_utc <= watermark.created_utc:
                 continue
-            standard_url: str = self.clean(submission.url)
-            hostname: str = standard_url.split('/')[2]
-            middleman: str = hostname.split('.')[0]
-            if middleman not in middlemen:
-                middlemen.append(middleman)
+            watermarks[name] = self.watermarks[name] = Watermark(
+                submission.fullname, submission.created_utc)
+            batch.append(Post(submission.url, submission.selftext))
 
-        return middlemen
+    def commit_watermarks(self) -> None:
+        """Persist watermarks once the links of the fetched posts are resolved."""
+        for subreddit, watermark in self.watermarks.items():
+            self.cache.set_watermark(subreddit=subreddit, fullname=watermark.fullname,
+                                     created_utc=watermark.created_utc)
 
     def parse_markdown(self, markdown: str) -> list[str]:
         """Return list of middleman URLs from Reddit post with multiple middleman links."""
@@ -82,30 +142,27 @@ class RedditClient:
         matches: list[tuple[str, str]] = re.findall(pattern, markdown)
         middleman_urls: list[str] = []
         for _title, url in matches:
-            middleman_urls.append(self.clean(url))
+            middleman_urls.append(self.normalize(url))
         return sorted(set(middleman_urls))
 
-    def get_middleman_urls(self, middlemen: list[str]) -> dict[str, list[str]]:
-        """Return mapping between middlemen and submission links."""
-        urls: dict[str, list[str]] = {}
-        for middleman in middlemen:
-            urls[middleman] = []
-        udemy_urls: list[str] = []
+    def get_middleman_urls(self) -> dict[str, list[str]]:
+        """Return mapping between middlemen and submission links, bucketed in a single pass."""
+        urls: list[str] = []
         for submission in self.submissions:
             if submission.selftext:
-                udemy_urls.extend(self.parse_markdown(
-                    submission.selftext))
-            if submission.url:
-                udemy_urls.append(self.clean(submission.url))
-        for middleman in middlemen:
-            for url in udemy_urls:
-                hostname: str = url.split('/')[2]
-                intermediary: str = hostname.split('.')[0]
-                if intermediary == middleman:
-                    urls[middleman].append(url)
-        for middleman in middlemen:
-            urls[middleman] = sorted(set(urls[middleman]))
-        return urls
+                urls.extend(self.parse_markdown(submission.selftext))
+            result = urlparse(submission.url)
+            # Self posts link back to Reddit and carry their links in the self-text.
+            if result.scheme and result.netloc and get_middleman(submission.url) != 'reddit':
+                urls.append(self.normalize(submission.url))
+        return bucket(urls)
+
+    def normalize(self, url: str) -> str:
+        """Return cleaned middleman link, keeping the coupon code of direct Udemy links."""
+        url = unwrap(url, self.middlemen)
+        if get_middleman(url) == UDEMY:
+            return clean_udemy_url(url)
+        return self.clean(url)
 
     def clean(self, url: str) -> str:
         """Return cleaned middlemen link."""
@@ -10,8 +10,18 @@ class BaseConfig(BaseModel):
 
 class BotConfig(BaseConfig):
     """Encapsulate and validate bot configuration attributes."""
+    backoff_base: float
+    backoff_cap: float
+    max_pages: int
+    max_memory: int
 
 
 class SpiderConfig(BaseConfig):
     """Encapsulate and validate spider configuration attributes."""
     threads: int
+    max_threads: int
+    cache_ttl: int
+    stream: bool
+    drain: int
+    parser: str
+    bulk: bool
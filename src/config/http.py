@@ -0,0 +1,11 @@
+"""Configuration model for the shared HTTP transport."""
+from pydantic import BaseModel
+
+
+class HttpConfig(BaseModel):
+    """Encapsulate and validate shared HTTP transport configuration attributes."""
+    http2: bool
+    dns_ttl: int
+    keepalive_expiry: int
+    default_limit: int
+    limits: dict[str, int]
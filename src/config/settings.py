@@ -1,5 +1,5 @@
 """Configure Udemate based on environment variables in .env file."""
-from typing import Final, Optional
+from typing import Final, Literal, Optional
 from datetime import datetime
 
 from pydantic import Field
@@ -11,6 +11,29 @@ MIN_SUBREDDIT_LIMIT: Final[int] = 0
 MAX_SUBREDDIT_LIMIT: Final[int] = 1000
 
 DEFAULT_BROWSER_MAJOR_VERSION: Final[int] = 142
+DEFAULT_DRIVER_MAX_PAGES: Final[int] = 100
+DEFAULT_DRIVER_MAX_MEMORY: Final[int] = 1024
+DEFAULT_BROWSER_MEMORY_BUDGET: Final[int] = 4096
+DEFAULT_BLOCKED_URLS: Final[tuple[str, ...]] = (
+    '*.css', '*.woff', '*.woff2', '*.ttf', '*.otf', '*.png', '*.jpg', '*.jpeg', '*.gif',
+    '*.webp', '*.svg', '*.ico', '*.mp4', '*.webm', '*.mp3',
+    '*google-analytics.com*', '*googletagmanager.com*', '*googlesyndication.com*',
+    '*doubleclick.net*', '*adservice.google.*', '*facebook.net*', '*hotjar.com*'
+)
+
+DEFAULT_RESOLUTION_TTL: Final[int] = 72
+
+DEFAULT_PIPELINE_SIZE: Final[int] = 256
+
+DEFAULT_MAX_CONCURRENCY: Final[int] = 32
+DEFAULT_STREAM_DRAIN_BYTES: Final[int] = 65536
+
+DEFAULT_BACKOFF_BASE: Final[float] = 1.0
+DEFAULT_BACKOFF_CAP: Final[float] = 30.0
+
+DEFAULT_HTTP_POOL_LIMIT: Final[int] = 25
+DEFAULT_HTTP_KEEPALIVE_EXPIRY: Final[int] = 60
+DEFAULT_DNS_CACHE_TTL: Final[int] = 300
 
 BOT_DEFAULTS: Final[dict[str, dict[str, int]]] = {
     'coursecouponz': {'retries': 3, 'threads': 2, 'timeout': 30},
@@ -22,10 +45,13 @@ BOT_DEFAULTS: Final[dict[str, dict[str, int]]] = {
     'line51': {'retries': 3, 'threads': 2, 'timeout': 30},
     'realdiscount': {'retries': 3, 'threads': 2, 'timeout': 30},
     'webhelperapp': {'retries': 3, 'threads': 2, 'timeout': 30},
-    'udemy': {'retries': 3, 'timeout': 10}
+    'udemy': {'retries': 3, 'threads': 1, 'timeout': 10}
 }
 
-FORMATTED_DATE: Final[str] = datetime.today().strftime('%Y%m%d')
+
+def formatted_date() -> str:
+    """Return today's date partition, evaluated on every call so long runs roll over."""
+    return datetime.today().strftime('%Y%m%d')
 
 
 class Settings(BaseSettings):
@@ -69,13 +95,92 @@ class Settings(BaseSettings):
     user_data_dir: str = Field(
         description='Path to Brave Browser user data directory'
     )
+    shared_browser: bool = Field(
+        description='Run all browser spiders in tabs of one shared headless browser',
+        default=False
+    )
+    debugger_address: Optional[str] = Field(
+        description='host:port of a running browser to enroll with instead of launching one',
+        default=None
+    )
+    scrape_debugger_address: Optional[str] = Field(
+        description='host:port of a running browser whose tabs browser spiders use',
+        default=None
+    )
+    page_load_strategy: Literal['normal', 'eager', 'none'] = Field(
+        description='How long headless spider drivers wait for page loads',
+        default='eager'
+    )
+    blocked_urls: list[str] = Field(
+        description='URL patterns headless spider drivers never download',
+        default=list(DEFAULT_BLOCKED_URLS)
+    )
+    driver_max_pages: int = Field(
+        description='Pages a browser loads before it is replaced by a fresh one (0 disables)',
+        default=DEFAULT_DRIVER_MAX_PAGES
+    )
+    driver_max_memory: int = Field(
+        description='Memory in MB of a browser process tree before it is replaced (0 disables)',
+        default=DEFAULT_DRIVER_MAX_MEMORY
+    )
+    browser_memory_budget: int = Field(
+        description='Memory in MB of all browsers above which no new pages are loaded (0 disables)',
+        default=DEFAULT_BROWSER_MEMORY_BUDGET
+    )
+
+    http2: bool = Field(
+        description='Negotiate HTTP/2 with middlemen (requires the h2 package)',
+        default=False
+    )
+    http_pool_limit: int = Field(
+        description='Maximum number of pooled connections per host without a spider',
+        default=DEFAULT_HTTP_POOL_LIMIT
+    )
+    http_keepalive_expiry: int = Field(
+        description='Time (in seconds) idle connections are kept alive',
+        default=DEFAULT_HTTP_KEEPALIVE_EXPIRY
+    )
+    dns_cache_ttl: int = Field(
+        description='Time (in seconds) resolved hostnames are cached',
+        default=DEFAULT_DNS_CACHE_TTL
+    )
+
+    max_concurrency: int = Field(
+        description='Upper bound of the adaptive number of concurrent requests per middleman',
+        default=DEFAULT_MAX_CONCURRENCY,
+        ge=1
+    )
+    stream_extraction: bool = Field(
+        description='Stream middleman pages and stop downloading once the coupon anchor is found',
+        default=True
+    )
+    stream_drain_bytes: int = Field(
+        description='Largest rest of a streamed HTTP/1.1 page (in bytes) still downloaded after '
+                    'the coupon anchor so the connection can be reused',
+        default=DEFAULT_STREAM_DRAIN_BYTES,
+        ge=0
+    )
+    html_parser: Literal['auto', 'selectolax', 'lxml', 'html.parser'] = Field(
+        description='HTML parser backend of HTTP spiders for WordPress batches and, with '
+                    'stream extraction off, for whole middleman pages',
+        default='auto'
+    )
+    wordpress_bulk: bool = Field(
+        description='Resolve links of WordPress middlemen in batches through their REST API',
+        default=True
+    )
+    resolution_ttl: int = Field(
+        description='Time (in hours) a resolved middleman link is served from cache and a '
+                    'pending Udemy link is still enrolled into',
+        default=DEFAULT_RESOLUTION_TTL
+    )
 
     coursecouponz_retries: int = Field(
         description='Maximum number of retries for Course Couponz requests',
         default=BOT_DEFAULTS['coursecouponz']['retries']
     )
     coursecouponz_threads: int = Field(
-        description='Number of threads for Course Couponz requests',
+        description='Initial number of concurrent Course Couponz requests',
         default=BOT_DEFAULTS['coursecouponz']['threads']
     )
     coursecouponz_timeout: int = Field(
@@ -88,7 +193,7 @@ class Settings(BaseSettings):
         default=BOT_DEFAULTS['coursetreat']['retries']
     )
     coursetreat_threads: int = Field(
-        description='Number of threads for Course Treat requests',
+        description='Initial number of concurrent Course Treat requests',
         default=BOT_DEFAULTS['coursetreat']['threads']
     )
     coursetreat_timeout: int = Field(
@@ -101,7 +206,7 @@ class Settings(BaseSettings):
         default=BOT_DEFAULTS['easylearn']['retries']
     )
     easylearn_threads: int = Field(
-        description='Number of threads for Easy Learning requests',
+        description='Initial number of concurrent Easy Learning requests',
         default=BOT_DEFAULTS['easylearn']['threads']
     )
     easylearn_timeout: int = Field(
@@ -127,7 +232,7 @@ class Settings(BaseSettings):
         default=BOT_DEFAULTS['idownloadcoupon']['retries']
     )
     idownloadcoupon_threads: int = Field(
-        description='Number of threads for IDownloadCoupon requests',
+        description='Initial number of concurrent IDownloadCoupon requests',
         default=BOT_DEFAULTS['idownloadcoupon']['threads']
     )
     idownloadcoupon_timeout: int = Field(
@@ -140,7 +245,7 @@ class Settings(BaseSettings):
         default=BOT_DEFAULTS['inventhigh']['retries']
     )
     inventhigh_threads: int = Field(
-        description='Number of threads for InventHigh requests and actions',
+        description='Initial number of concurrent InventHigh requests',
         default=BOT_DEFAULTS['inventhigh']['threads']
     )
     inventhigh_timeout: int = Field(
@@ -179,7 +284,7 @@ class Settings(BaseSettings):
         default=BOT_DEFAULTS['webhelperapp']['retries']
     )
     webhelperapp_threads: int = Field(
-        description='Number of threads for WebHelperApp requests and actions',
+        description='Initial number of concurrent WebHelperApp requests',
         default=BOT_DEFAULTS['webhelperapp']['threads']
     )
     webhelperapp_timeout: Optional[int] = Field(
@@ -187,6 +292,11 @@ class Settings(BaseSettings):
         default=BOT_DEFAULTS['webhelperapp']['timeout']
     )
 
+    pipeline_size: int = Field(
+        description='Maximum number of resolved Udemy links waiting for enrollment in hybrid mode',
+        default=DEFAULT_PIPELINE_SIZE
+    )
+
     udemy_email: str = Field(
         description='Email address for Udemy account',
     )
@@ -198,6 +308,19 @@ class Settings(BaseSettings):
         description='Timeout (in seconds) for web actions such as enrollments',
         default=BOT_DEFAULTS['udemy']['timeout']
     )
+    udemy_threads: int = Field(
+        description='Number of GUI browsers enrolling into courses in parallel',
+        default=BOT_DEFAULTS['udemy']['threads'],
+        ge=1
+    )
+    udemy_backoff_base: float = Field(
+        description='Base delay (in seconds) of the jittered backoff between failed web actions',
+        default=DEFAULT_BACKOFF_BASE
+    )
+    udemy_backoff_cap: float = Field(
+        description='Maximum delay (in seconds) of the jittered backoff between failed web actions',
+        default=DEFAULT_BACKOFF_CAP
+    )
 
     gotify_base_url: str = Field(
         description='Base URL of Gotify server'
@@ -16,7 +16,7 @@ def parse_arguments() -> Namespace:
     parser: ArgumentParser = ArgumentParser()
     parser.add_argument(
         '--mode',
-        choices=['headless', 'gui', 'hybrid'],
+        choices=['headless', 'gui', 'hybrid', 'watch'],
         default='hybrid'
     )
     parser.add_argument(
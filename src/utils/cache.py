@@ -1,69 +1,83 @@
 """Improve performance by relying on cached Udemy links on startup."""
-import json
-from pathlib import Path
-
 from utils.logger import setup_logging
-from config.settings import FORMATTED_DATE
+from utils.store import PENDING, PROCESSED, get_store
 
 
 class Cache:
-    """Read and write cached middleman and Udemy links to JSON files."""
+    """Read and write cached middleman and Udemy links through the SQLite link store."""
 
     def __init__(self) -> None:
-        self.json_dir = Path(__file__).parent.parent.parent / \
-            'data' / FORMATTED_DATE / 'json'
-        self.json_dir.mkdir(parents=True, exist_ok=True)
+        self.store = get_store()
         self.logger = setup_logging()
         self.urls = {}
 
+    def import_legacy(self) -> None:
+        """Import links of the legacy daily JSON cache into the store, once per database."""
+        imported: int = self.store.import_json()
+        if imported:
+            self.logger.info('Imported %d links from legacy JSON cache.', imported)
+
     def read_json(self, filename: str) -> list[str]:
-        """Parse cached middleman and Udemy links with coupons from JSON files."""
-        file_path: Path = self.json_dir / filename
-        if file_path.exists():
-            with file_path.open('r', encoding='utf-8') as f:
-                self.urls[filename[:-5]] = list(json.load(f))
-            if self.urls[filename[:-5]]:
-                self.logger.info('Read %d links from %s.',
-                                 len(self.urls[filename[:-5]]), filename[:-5])
+        """Return cached middleman or Udemy links with coupons of a bot."""
+        self.urls[filename[:-5]] = self.store.get_links(bot=filename[:-5])
+        if self.urls[filename[:-5]]:
+            self.logger.info('Read %d links from %s.',
+                             len(self.urls[filename[:-5]]), filename[:-5])
             return self.urls[filename[:-5]]
-        self.logger.info('No links in JSON cache for %s.', filename[:-5])
+        self.logger.info('No links in cache for %s.', filename[:-5])
         return []
 
     def write_json(self, *, filename: str, data: list[str]) -> None:
-        """Write output to JSON file in 'json' directory within 'data' directory."""
-        file_path: Path = self.json_dir / filename
-        with file_path.open('w', encoding='utf-8') as f:
-            json.dump(
-                data, f,
-                ensure_ascii=False, indent=4
-            )
-            self.logger.info('Successfully written data to %s.', file_path)
+        """Upsert links of a bot, keeping the status of already known links."""
+        self.store.upsert_links(bot=filename[:-5], urls=data)
+        self.logger.info('Successfully written %d links for %s.',
+                         len(data), filename[:-5])
 
     def delete_json(self, filename: str) -> None:
-        """Clear JSON file in 'json' directory within 'data' directory."""
-        file_path: Path = self.json_dir / filename
-        file_path.unlink(missing_ok=True)
+        """Delete cached links of a bot."""
+        self.store.delete_links(filename[:-5])
         self.logger.info('Deleted %s.', filename[:-5])
 
     def read_jsonl(self, filename: str) -> list[str]:
-        """Return a list of processed links from the associated JSONL file."""
-        file_path: Path = self.json_dir / filename
-        if file_path.exists():
-            with file_path.open('r', encoding='utf-8') as f:
-                return [json.loads(line) for line in f]
-        return []
+        """Return a list of processed links of a bot."""
+        return self.store.get_links(bot=filename[:-6], status=PROCESSED)
 
     def append_jsonl(self, *, filename: str, url: str) -> None:
-        """Append middleman or Udemy link to corresponding JSONL file."""
-        file_path: Path = self.json_dir / filename
-        with file_path.open(mode='a', encoding='utf-8') as f:
-            json.dump(url, f, ensure_ascii=False)
-            f.write('\n')
-
-    def filter_urls(self, bot: str) -> list[str]:
-        """Return list of unprocessed links associated with middleman scraper or Udemy bot."""
-        filtered_urls: list[str] = sorted(set(self.read_json(
-            f'{bot}.json')) - set(self.read_jsonl(f'{bot}.jsonl')))
+        """Mark middleman or Udemy link as processed."""
+        self.store.upsert_links(bot=filename[:-6], urls=[url], status=PROCESSED)
+
+    def filter_urls(self, bot: str, ttl: int | None = None) -> list[str]:
+        """
+        Return list of unprocessed links associated with middleman scraper or Udemy bot,
+        optionally only those seen within the last `ttl` hours.
+        """
+        filtered_urls: list[str] = self.store.get_links(
+            bot=bot, status=PENDING, max_age=ttl * 3600 if ttl is not None else None)
         self.logger.info(
             'Found %d unprocessed links for %s bot.', len(filtered_urls), bot.title())
         return filtered_urls
+
+    def get_resolutions(self, *, urls: list[str], ttl: int) -> dict[str, str]:
+        """Return cached Udemy links of middleman links resolved within the last `ttl` hours."""
+        return self.store.get_resolutions(urls=urls, max_age=ttl * 3600)
+
+    def set_resolution(self, *, middleman_url: str, udemy_url: str) -> None:
+        """Cache the Udemy link a middleman link resolved to."""
+        self.store.put_resolution(middleman_url=middleman_url, udemy_url=udemy_url)
+
+    def get_outcome(self, slug: str) -> tuple[str, str | None] | None:
+        """Return cached enrollment outcome and coupon code of a course."""
+        return self.store.get_course(slug)
+
+    def set_outcome(self, *, slug: str, outcome: str, coupon: str | None) -> None:
+        """Cache enrollment outcome of a course along with the coupon code tried."""
+        self.store.put_course(slug=slug, status=outcome, coupon=coupon)
+
+    def get_watermark(self, subreddit: str) -> tuple[str, float] | None:
+        """Return fullname and creation time of the newest post ingested from a subreddit."""
+        return self.store.get_watermark(subreddit)
+
+    def set_watermark(self, *, subreddit: str, fullname: str, created_utc: float) -> None:
+        """Remember the newest post ingested from a subreddit."""
+        self.store.put_watermark(
+            subreddit=subreddit, fullname=fullname, created_utc=created_utc)
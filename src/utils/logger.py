@@ -1,21 +1,48 @@
 """Setup Udemate logger to display stdout and write messages to log files."""
 
 import logging
-from logging import FileHandler, Formatter, Logger, StreamHandler
+from logging import FileHandler, Formatter, Logger, LogRecord, StreamHandler
 from pathlib import Path
 
-from config.settings import FORMATTED_DATE
+from config.settings import formatted_date
+
+LOGS_DIR: Path = Path(__file__).resolve().parents[2] / 'logs'
+
+
+class DatedFileHandler(FileHandler):
+    """Write to logs/<date>/udemate.log and move to a new directory when the date changes."""
+
+    def __init__(self) -> None:
+        self.date = formatted_date()
+        super().__init__(self.get_path(self.date), encoding='utf-8')
+
+    def get_path(self, date: str) -> Path:
+        """Return log file path of a date partition, creating its directory."""
+        logs_dir: Path = LOGS_DIR / date
+        logs_dir.mkdir(parents=True, exist_ok=True)
+        return logs_dir / 'udemate.log'
+
+    def emit(self, record: LogRecord) -> None:
+        """Roll over to today's partition before writing the record."""
+        date: str = formatted_date()
+        if date != self.date:
+            self.acquire()
+            try:
+                if self.stream:
+                    self.stream.close()
+                    self.stream = None
+                self.date = date
+                self.baseFilename = str(self.get_path(date))
+            finally:
+                self.release()
+        super().emit(record)
 
 
 def setup_logging() -> logging.Logger:
     """Configure and return logger for Udemate."""
     logger: Logger = logging.getLogger('udemate')
-    logs_dir = Path(__file__).resolve().parents[2] / 'logs' / FORMATTED_DATE
-    logs_dir.mkdir(parents=True, exist_ok=True)
     if not logger.hasHandlers():
-        file_handler: FileHandler = logging.FileHandler(
-            logs_dir / 'udemate.log',
-            encoding='utf-8')
+        file_handler: FileHandler = DatedFileHandler()
         stream_handler: StreamHandler = logging.StreamHandler()
         logger.setLevel(logging.DEBUG)
         file_handler.setLevel(logging.DEBUG)
@@ -0,0 +1,204 @@
+"""Persist middleman and Udemy links in an embedded SQLite database."""
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Final, Iterable
+
+from config.settings import formatted_date
+
+DATA_DIR: Final[Path] = Path(__file__).parent.parent.parent / 'data'
+DB_PATH: Final[Path] = DATA_DIR / 'udemate.db'
+
+SCHEMA: Final[str] = '''
+CREATE TABLE IF NOT EXISTS links (
+    bot TEXT NOT NULL,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (bot, url)
+);
+CREATE INDEX IF NOT EXISTS links_bot_status ON links (bot, status);
+CREATE TABLE IF NOT EXISTS resolutions (
+    middleman_url TEXT PRIMARY KEY,
+    udemy_url TEXT NOT NULL,
+    resolved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS courses (
+    slug TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    coupon TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS watermarks (
+    subreddit TEXT PRIMARY KEY,
+    fullname TEXT NOT NULL,
+    created_utc REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+SQLITE_MAX_VARIABLES: Final[int] = 500
+
+PENDING: Final[str] = 'pending'
+PROCESSED: Final[str] = 'processed'
+
+
+class Store:
+    """Read and write links with their processing status in a WAL-mode SQLite database."""
+
+    def __init__(self, path: Path = DB_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.executescript(SCHEMA)
+
+    def upsert_links(self, *, bot: str, urls: Iterable[str], status: str = PENDING,
+                     timestamp: float | None = None) -> None:
+        """Insert links in one batch, only ever promoting pending links to processed."""
+        with self.lock, self.connection:
+            self.write_links(bot=bot, urls=urls, status=status,
+                             timestamp=timestamp or time.time())
+
+    def write_links(self, *, bot: str, urls: Iterable[str], status: str,
+                    timestamp: float) -> None:
+        """Upsert links within the caller's transaction."""
+        update_status: str = 'links.status' if status == PENDING else 'excluded.status'
+        self.connection.executemany(
+            'INSERT INTO links (bot, url, status, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?) '
+            f'ON CONFLICT (bot, url) DO UPDATE SET status = {update_status}, '
+            'updated_at = excluded.updated_at',
+            [(bot, url, status, timestamp, timestamp) for url in urls]
+        )
+
+    def get_links(self, *, bot: str, status: str | None = None,
+                  max_age: float | None = None) -> list[str]:
+        """
+        Return links of a bot, optionally restricted to one status and to links seen less than
+        max_age seconds ago.
+        """
+        query: str = 'SELECT url FROM links WHERE bot = ?'
+        params: list[str | float] = [bot]
+        if status is not None:
+            query += ' AND status = ?'
+            params.append(status)
+        if max_age is not None:
+            query += ' AND updated_at >= ?'
+            params.append(time.time() - max_age)
+        with self.lock:
+            cursor: sqlite3.Cursor = self.connection.execute(f'{query} ORDER BY url', params)
+            return [url for (url,) in cursor.fetchall()]
+
+    def delete_links(self, bot: str) -> None:
+        """Delete every link of a bot."""
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM links WHERE bot = ?', (bot,))
+
+    def get_resolutions(self, *, urls: list[str], max_age: float) -> dict[str, str]:
+        """Return Udemy links of middleman links resolved less than max_age seconds ago."""
+        oldest: float = time.time() - max_age
+        resolutions: dict[str, str] = {}
+        with self.lock:
+            for i in range(0, len(urls), SQLITE_MAX_VARIABLES):
+                batch: list[str] = urls[i:i+SQLITE_MAX_VARIABLES]
+                placeholders: str = ', '.join('?' * len(batch))
+                cursor: sqlite3.Cursor = self.connection.execute(
+                    'SELECT middleman_url, udemy_url FROM resolutions '
+                    f'WHERE middleman_url IN ({placeholders}) AND resolved_at >= ?',
+                    (*batch, oldest))
+                resolutions.update(cursor.fetchall())
+        return resolutions
+
+    def put_resolution(self, *, middleman_url: str, udemy_url: str) -> None:
+        """Remember the Udemy link a middleman link resolved to."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT INTO resolutions (middleman_url, udemy_url, resolved_at) '
+                'VALUES (?, ?, ?) ON CONFLICT (middleman_url) DO UPDATE SET '
+                'udemy_url = excluded.udemy_url, resolved_at = excluded.resolved_at',
+                (middleman_url, udemy_url, time.time()))
+
+    def get_course(self, slug: str) -> tuple[str, str | None] | None:
+        """Return last known status and coupon code of a course."""
+        with self.lock:
+            return self.connection.execute(
+                'SELECT status, coupon FROM courses WHERE slug = ?', (slug,)).fetchone()
+
+    def put_course(self, *, slug: str, status: str, coupon: str | None) -> None:
+        """Record the outcome of visiting a course."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT INTO courses (slug, status, coupon, updated_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (slug) DO UPDATE SET status = excluded.status, '
+                'coupon = excluded.coupon, updated_at = excluded.updated_at',
+                (slug, status, coupon, time.time()))
+
+    def get_watermark(self, subreddit: str) -> tuple[str, float] | None:
+        """Return fullname and creation time of the newest post ingested from a subreddit."""
+        with self.lock:
+            return self.connection.execute(
+                'SELECT fullname, created_utc FROM watermarks WHERE subreddit = ?',
+                (subreddit,)).fetchone()
+
+    def put_watermark(self, *, subreddit: str, fullname: str, created_utc: float) -> None:
+        """Advance the watermark of a subreddit."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT INTO watermarks (subreddit, fullname, created_utc, updated_at) '
+                'VALUES (?, ?, ?, ?) ON CONFLICT (subreddit) DO UPDATE SET '
+                'fullname = excluded.fullname, created_utc = excluded.created_utc, '
+                'updated_at = excluded.updated_at',
+                (subreddit, fullname, created_utc, time.time()))
+
+    def import_json(self, data_dir: Path = DATA_DIR) -> int:
+        """Import the legacy data/<date>/json directories once and return the number of links."""
+        count: int = 0
+        today_date: str = formatted_date()
+        with self.lock, self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            imported = self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'json_imported'").fetchone()
+            if imported:
+                return 0
+            for file_path in sorted(data_dir.glob('*/json/*.json*')):
+                # Links left over from earlier days belong to runs that are already over.
+                today: bool = file_path.parent.parent.name == today_date
+                try:
+                    timestamp: float = datetime.strptime(
+                        file_path.parent.parent.name, '%Y%m%d').timestamp()
+                except ValueError:
+                    timestamp = file_path.stat().st_mtime
+                with file_path.open('r', encoding='utf-8') as f:
+                    if file_path.suffix == '.jsonl':
+                        urls: list[str] = [json.loads(line)
+                                           for line in f if line.strip()]
+                        status: str = PROCESSED
+                    else:
+                        urls = list(json.load(f))
+                        status = PENDING if today else PROCESSED
+                self.write_links(bot=file_path.stem, urls=urls,
+                                 status=status, timestamp=timestamp)
+                count += len(urls)
+            self.connection.execute(
+                "INSERT INTO meta (key, value) VALUES ('json_imported', ?)",
+                (str(time.time()),))
+        return count
+
+
+@lru_cache(maxsize=None)
+def get_store(path: Path = DB_PATH) -> Store:
+    """Return the store of a database, shared by every cache of the process."""
+    return Store(path)
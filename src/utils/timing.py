@@ -0,0 +1,49 @@
+"""Pause between failed attempts and measure where the Udemy bot spends its time."""
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class Backoff:
+    """Exponential backoff with full jitter, used only between failed attempts."""
+
+    def __init__(self, *, base: float, cap: float, factor: float = 2.0) -> None:
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+
+    def delay(self, attempt: int) -> float:
+        """Return a random delay (in seconds) for the given zero-based attempt."""
+        return random.uniform(0, min(self.cap, self.base * self.factor ** attempt))
+
+    def sleep(self, attempt: int) -> float:
+        """Sleep for a jittered delay and return how long it slept."""
+        delay: float = self.delay(attempt)
+        time.sleep(delay)
+        return delay
+
+
+class StageTimer:
+    """Accumulate wall-clock time spent in named stages."""
+
+    def __init__(self) -> None:
+        self.durations: defaultdict[str, float] = defaultdict(float)
+        self.counts: defaultdict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block and add it to the stage total."""
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] += time.perf_counter() - start
+            self.counts[name] += 1
+
+    def summary(self) -> list[tuple[str, float, int]]:
+        """Return (stage, total seconds, count) tuples, slowest stage first."""
+        return sorted(((name, duration, self.counts[name])
+                       for name, duration in self.durations.items()),
+                      key=lambda item: item[1], reverse=True)
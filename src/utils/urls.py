@@ -0,0 +1,115 @@
+"""Route links to middleman spiders by hostname and decode wrapped links locally."""
+import base64
+import binascii
+from functools import lru_cache
+from typing import Collection, Final, Iterable
+from urllib.parse import ParseResult, parse_qs, unquote, urlencode, urlparse, urlunparse
+
+UDEMY: Final[str] = 'udemy'
+
+MAX_UNWRAP_DEPTH: Final[int] = 5
+# Hostname suffix of a known redirector and the query parameters carrying the destination.
+# Parameters such as `to` or `url` are only trusted on these hosts, never on arbitrary sites.
+WRAPPERS: Final[tuple[tuple[str, tuple[str, ...]], ...]] = (
+    ('linksynergy.com', ('murl', 'RD_PARM1')),
+    ('google.com', ('q', 'url')),
+    ('facebook.com', ('u',)),
+    ('instagram.com', ('u',)),
+    ('reddit.com', ('url',)),
+    ('youtube.com', ('q',)),
+    ('duckduckgo.com', ('uddg',)),
+    ('away.vk.com', ('to',)),
+    ('slack-redir.net', ('url',)),
+    ('t.umblr.com', ('z',)),
+)
+# Parameters trusted on any other host, but only when they carry a Udemy link, as in the
+# trk.udemy.com/c/...?u=<udemy link> affiliate links.
+UDEMY_WRAPPER_PARAMS: Final[tuple[str, ...]] = (
+    'u', 'url', 'murl', 'redirect', 'redirect_url', 'dest', 'destination', 'target', 'to',
+    'link', 'out')
+# Redirectors whose whole query string is the destination, e.g. href.li/?https://...
+QUERY_WRAPPERS: Final[frozenset[str]] = frozenset({'href.li', 'anon.to', 'nullrefer.com'})
+
+
+@lru_cache(maxsize=1024)
+def get_label(netloc: str) -> str:
+    """Return first label of a hostname without the www. prefix, e.g. 'real' for www.real.discount."""
+    hostname: str = netloc.rsplit('@', 1)[-1].split(':', 1)[0].lower()
+    return hostname.removeprefix('www.').split('.', 1)[0]
+
+
+def get_middleman(url: str) -> str:
+    """Return the middleman key of a link."""
+    return get_label(urlparse(url).netloc)
+
+
+def clean_udemy_url(url: str) -> str:
+    """Return Udemy link without tracking parameters, keeping only the coupon code."""
+    parsed: ParseResult = urlparse(url)
+    params: dict[str, list[str]] = parse_qs(parsed.query)
+    clean_params: dict[str, list[str]] = {}
+    if 'couponCode' in params:
+        clean_params['couponCode'] = params['couponCode']
+    return urlunparse(parsed._replace(query=urlencode(clean_params, doseq=True)))
+
+
+def bucket(urls: Iterable[str]) -> dict[str, list[str]]:
+    """Group links by middleman key in a single pass, deduplicated and sorted."""
+    buckets: dict[str, set[str]] = {}
+    for url in urls:
+        buckets.setdefault(get_middleman(url), set()).add(url)
+    return {middleman: sorted(links) for middleman, links in buckets.items()}
+
+
+def decode_target(value: str) -> str | None:
+    """Return absolute http(s) link carried by a parameter value, decoding base64 if needed."""
+    for candidate in (value, unquote(value)):
+        if candidate.startswith(('http://', 'https://')):
+            return candidate
+    if value.startswith('aHR0c'):
+        try:
+            decoded: str = base64.urlsafe_b64decode(
+                value + '=' * (-len(value) % 4)).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+        if decoded.startswith(('http://', 'https://')):
+            return decoded
+    return None
+
+
+def unwrap_once(url: str, keep: Collection[str] = frozenset()) -> str | None:
+    """
+    Return destination of a known redirect, affiliate or tracking wrapper, if any. Links of
+    middlemen in `keep` are left alone, as their spiders resolve them.
+    """
+    parsed: ParseResult = urlparse(url)
+    hostname: str = (parsed.hostname or '').removeprefix('www.')
+    label: str = get_label(parsed.netloc)
+    if not hostname or label == UDEMY or label in keep:
+        return None
+    if hostname in QUERY_WRAPPERS and parsed.query:
+        return decode_target(parsed.query)
+    params: dict[str, list[str]] = parse_qs(parsed.query)
+    for suffix, names in WRAPPERS:
+        if hostname != suffix and not hostname.endswith(f'.{suffix}'):
+            continue
+        for name in names:
+            target: str | None = decode_target(params[name][0]) if name in params else None
+            if target:
+                return target
+    for name in UDEMY_WRAPPER_PARAMS:
+        target = decode_target(params[name][0]) if name in params else None
+        if target and get_middleman(target) == UDEMY:
+            return target
+    return None
+
+
+def unwrap(url: str, keep: Collection[str] = frozenset()) -> str:
+    """Recursively decode wrapped links without any network request."""
+    for _depth in range(MAX_UNWRAP_DEPTH):
+        target: str | None = unwrap_once(url, keep)
+        if target is None:
+            break
+        url = target
+    return url
+
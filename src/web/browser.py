@@ -2,20 +2,51 @@
 import os
 import shutil
 import platform
+import threading
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from queue import Empty, Queue
+from typing import Iterable, Iterator
 
 import undetected_chromedriver as uc
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from urllib3.exceptions import HTTPError
 
 from utils.logger import Logger
+from web.memory import MemoryGovernor, driver_memory
+
+# Raised when a driver or its browser crashed or hung, including urllib3 errors of chromedriver.
+BROWSER_ERRORS: tuple[type[Exception], ...] = (WebDriverException, HTTPError, OSError)
+
+
+def is_alive(driver: uc.Chrome) -> bool:
+    """Return a flag indicating whether a driver and its browser still respond."""
+    try:
+        _handles: list[str] = driver.window_handles
+        return True
+    except BROWSER_ERRORS:
+        return False
 
 
 class Browser(ABC):
     """Manage browser configuration and expose Undetected Chromedriver."""
 
-    def __init__(self, *, user_data_dir: str, major_version: int, logger: Logger) -> None:
+    def __init__(self, *, user_data_dir: str, major_version: int, logger: Logger,
+                 page_load_strategy: str = 'normal', blocked_urls: Iterable[str] = (),
+                 debugger_address: str | None = None,
+                 scrape_debugger_address: str | None = None) -> None:
         self.major_version = major_version
         self.user_data_dir = user_data_dir
         self.logger = logger
+        # Scrape profile of headless spider drivers.
+        self.page_load_strategy = page_load_strategy
+        self.blocked_urls = list(blocked_urls)
+        # Remote debugging addresses of already running browsers for enrollment and scraping.
+        self.debugger_address = debugger_address
+        self.scrape_debugger_address = scrape_debugger_address
+        self.attached: set[webdriver.Chrome] = set()
+        self.setup_lock = threading.Lock()
 
     @abstractmethod
     def get_executable_path(self) -> str:
@@ -28,11 +59,19 @@ class Browser(ABC):
             self.logger.info('Deleted user data directory: %s',
                              self.user_data_dir)
 
-    def setup(self, headless: bool) -> uc.Chrome:
+    def setup(self, headless: bool, profile: bool = True, scrape: bool = False) -> uc.Chrome:
         """
         Return Undetected Chromedriver for a Chromium browser either in headless mode for scraping
-        or in non-headless mode for automating course enrollment.
+        or in non-headless mode for automating course enrollment. Additional enrollment workers
+        pass `profile=False` to run in a throwaway profile instead of the user data directory.
+        Spider drivers pass `scrape=True` to return from page loads early and skip blocked URLs.
+        The profile browser and spider drivers attach to running browsers instead if their
+        debugger addresses are configured.
         """
+        if scrape and self.scrape_debugger_address:
+            return self.attach(self.scrape_debugger_address, scrape=True)
+        if not headless and profile and self.debugger_address:
+            return self.attach(self.debugger_address)
         options = uc.ChromeOptions()
         browser_executable: str = self.get_executable_path()
 
@@ -60,7 +99,9 @@ class Browser(ABC):
             ]
         for arg in common_args + (headless_args if headless else gui_args):
             options.add_argument(arg)
-        if not headless:
+        if scrape:
+            options.page_load_strategy = self.page_load_strategy
+        if not headless and profile:
             self.delete_user_data_dir()
             return uc.Chrome(
                 options=options,
@@ -69,9 +110,243 @@ class Browser(ABC):
                 user_data_dir=self.user_data_dir,
                 headless=headless
             )
-        return uc.Chrome(
+        driver: uc.Chrome = uc.Chrome(
             options=options,
             version_main=self.major_version,
             browser_executable_path=browser_executable,
             headless=headless
         )
+        if scrape and self.blocked_urls:
+            self.block_urls(driver)
+        return driver
+
+    def attach(self, address: str, scrape: bool = False) -> webdriver.Chrome:
+        """
+        Return a plain Selenium driver attached to a browser started with
+        --remote-debugging-port, reusing its warm process, cache, profile and login.
+        """
+        options = webdriver.ChromeOptions()
+        options.debugger_address = address
+        if scrape:
+            options.page_load_strategy = self.page_load_strategy
+        driver: webdriver.Chrome = webdriver.Chrome(options=options)
+        if scrape and self.blocked_urls:
+            self.block_urls(driver)
+        self.attached.add(driver)
+        self.logger.info('Attached to running browser at %s.', address)
+        return driver
+
+    def quit(self, driver: uc.Chrome) -> None:
+        """Quit a launched browser, or only detach from a browser it attached to."""
+        if driver in self.attached:
+            self.attached.discard(driver)
+            driver.service.stop()
+            return
+        driver.quit()
+
+    def block_urls(self, driver: uc.Chrome) -> None:
+        """Stop a driver from downloading stylesheets, fonts, media, ads and analytics."""
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.blocked_urls})
+
+
+class BrowserPool(ABC):
+    """
+    Share headless drivers between the worker threads of browser spiders. Drivers are recycled
+    after `max_pages` leases or once their process tree exceeds `max_memory` MB (0 disables
+    either limit), and new pages are held back while all browsers exceed their memory budget.
+    """
+
+    def __init__(self, *, browser: Browser, size: int, governor: MemoryGovernor,
+                 max_pages: int, max_memory: int) -> None:
+        self.browser = browser
+        self.size = size
+        self.logger = browser.logger
+        self.governor = governor
+        self.max_pages = max_pages
+        self.max_memory = max_memory
+        self.drivers: list[uc.Chrome] = []
+        self.pages: dict[uc.Chrome, int] = {}
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def lease(self) -> Iterator[uc.Chrome]:
+        """Yield a driver for exclusive use by the caller."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Quit every driver launched by the pool."""
+
+    def launch(self) -> uc.Chrome:
+        """Launch a headless driver, one at a time since Undetected Chromedriver patches its binary."""
+        with self.browser.setup_lock:
+            driver: uc.Chrome = self.browser.setup(headless=True, scrape=True)
+        with self.lock:
+            self.drivers.append(driver)
+            self.pages[driver] = 0
+        self.governor.track(driver)
+        self.logger.info('Launched headless driver %d/%d.',
+                         len(self.drivers), self.size)
+        return driver
+
+    def discard(self, driver: uc.Chrome) -> None:
+        """Quit driver and forget about it."""
+        with self.lock:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+            self.pages.pop(driver, None)
+        self.governor.untrack(driver)
+        try:
+            self.browser.quit(driver)
+        except BROWSER_ERRORS as e:
+            self.logger.error('Failed to quit headless driver: %r', e)
+
+    def is_healthy(self, driver: uc.Chrome) -> bool:
+        """Return a flag indicating whether the driver still responds."""
+        return is_alive(driver)
+
+    def count_page(self, driver: uc.Chrome) -> None:
+        """Count a lease of the driver towards its page limit."""
+        with self.lock:
+            self.pages[driver] = self.pages.get(driver, 0) + 1
+
+    def recycle_reason(self, driver: uc.Chrome) -> str | None:
+        """Return why a driver should be replaced by a fresh one, if it should."""
+        if not self.is_healthy(driver):
+            return 'it stopped responding'
+        pages: int = self.pages.get(driver, 0)
+        if self.max_pages and pages >= self.max_pages:
+            return f'it loaded {pages} pages'
+        if self.max_memory and (memory := driver_memory(driver)) > self.max_memory:
+            return f'it uses {memory} MB'
+        return None
+
+
+class DriverPool(BrowserPool):
+    """Lease up to `size` headless browsers to the worker threads of a spider."""
+
+    def __init__(self, *, browser: Browser, size: int, governor: MemoryGovernor,
+                 max_pages: int, max_memory: int) -> None:
+        super().__init__(browser=browser, size=size, governor=governor,
+                         max_pages=max_pages, max_memory=max_memory)
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle: Queue[uc.Chrome] = Queue()
+
+    @contextmanager
+    def lease(self) -> Iterator[uc.Chrome]:
+        """Yield a healthy driver and return it to the pool afterwards."""
+        with self.slots:
+            if self.governor.over_budget():
+                self.trim()
+            self.governor.wait()
+            driver: uc.Chrome = self.acquire()
+            try:
+                yield driver
+            finally:
+                self.release(driver)
+
+    def acquire(self) -> uc.Chrome:
+        """Return a healthy idle driver or launch a new one."""
+        while True:
+            try:
+                driver: uc.Chrome = self.idle.get_nowait()
+            except Empty:
+                return self.launch()
+            if self.is_healthy(driver):
+                return driver
+            self.logger.warning('Replacing crashed headless driver.')
+            self.discard(driver)
+
+    def trim(self) -> None:
+        """Quit idle drivers to give memory back while browsers exceed their budget."""
+        while True:
+            try:
+                driver: uc.Chrome = self.idle.get_nowait()
+            except Empty:
+                return
+            self.logger.info('Quitting idle headless driver to save memory.')
+            self.discard(driver)
+
+    def release(self, driver: uc.Chrome) -> None:
+        """Return a driver to the pool or recycle it if it crashed or grew too much."""
+        self.count_page(driver)
+        reason: str | None = self.recycle_reason(driver)
+        if reason is None:
+            self.idle.put(driver)
+            return
+        self.logger.info('Recycling headless driver because %s.', reason)
+        self.discard(driver)
+
+    def close(self) -> None:
+        """Quit every driver launched by the pool."""
+        with self.lock:
+            drivers: list[uc.Chrome] = list(self.drivers)
+        for driver in drivers:
+            self.discard(driver)
+        while not self.idle.empty():
+            self.idle.get_nowait()
+
+
+class TabPool(BrowserPool):
+    """
+    Run every browser spider in tabs of one shared headless browser.
+
+    A WebDriver session executes one command at a time, so leases are handed out one after
+    another. Each lease gets a fresh tab that is closed afterwards to release its renderer.
+    """
+
+    def __init__(self, *, browser: Browser, governor: MemoryGovernor,
+                 max_pages: int, max_memory: int) -> None:
+        super().__init__(browser=browser, size=1, governor=governor,
+                         max_pages=max_pages, max_memory=max_memory)
+        self.tab_lock = threading.Lock()
+        self.driver: uc.Chrome | None = None
+        self.home: str | None = None
+
+    def get_driver(self) -> uc.Chrome:
+        """Return the shared driver, relaunching it if it stopped responding."""
+        if self.driver and not self.is_healthy(self.driver):
+            self.logger.warning('Relaunching unresponsive shared browser.')
+            self.discard(self.driver)
+            self.driver = None
+        if self.driver is None:
+            self.driver = self.launch()
+            self.home = self.driver.current_window_handle
+        return self.driver
+
+    @contextmanager
+    def lease(self) -> Iterator[uc.Chrome]:
+        """Yield the shared driver switched to a new tab and close the tab afterwards."""
+        with self.tab_lock:
+            self.governor.wait()
+            driver: uc.Chrome = self.get_driver()
+            driver.switch_to.new_window('tab')
+            try:
+                # Blocking is a setting of each tab, so the new one needs it too.
+                if self.browser.blocked_urls:
+                    self.browser.block_urls(driver)
+                yield driver
+            finally:
+                self.release(driver)
+
+    def release(self, driver: uc.Chrome) -> None:
+        """Close the leased tab and switch back to the first one, or recycle the browser."""
+        try:
+            if driver.current_window_handle != self.home:
+                driver.close()
+            driver.switch_to.window(self.home)
+        except BROWSER_ERRORS as e:
+            self.logger.warning('Failed to close tab of shared browser: %r', e)
+        self.count_page(driver)
+        reason: str | None = self.recycle_reason(driver)
+        if reason is not None:
+            self.logger.info('Recycling shared browser because %s.', reason)
+            self.discard(driver)
+            self.driver = None
+
+    def close(self) -> None:
+        """Quit the shared browser."""
+        with self.tab_lock:
+            if self.driver:
+                self.discard(self.driver)
+                self.driver = None
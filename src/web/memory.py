@@ -0,0 +1,95 @@
+"""Measure memory of browser process trees and keep their total within a budget."""
+import importlib
+import importlib.util
+import threading
+import time
+from logging import Logger
+from types import ModuleType
+
+import undetected_chromedriver as uc
+
+MEGABYTE: int = 1024 * 1024
+# Seconds between measurements while waiting for memory, and how long a lease waits at most.
+POLL_INTERVAL: float = 1.0
+MAX_WAIT: float = 60.0
+
+
+def load_psutil() -> ModuleType | None:
+    """Return psutil if it is installed."""
+    if importlib.util.find_spec('psutil') is None:
+        return None
+    return importlib.import_module('psutil')
+
+
+PSUTIL: ModuleType | None = load_psutil()
+
+
+def driver_memory(driver: uc.Chrome) -> int:
+    """Return resident memory in MB of a browser and its renderer, GPU and utility processes."""
+    pid: int | None = getattr(driver, 'browser_pid', None)
+    if PSUTIL is None or pid is None:
+        return 0
+    try:
+        process = PSUTIL.Process(pid)
+        processes = [process, *process.children(recursive=True)]
+    except PSUTIL.Error:
+        return 0
+    total: int = 0
+    for child in processes:
+        try:
+            total += child.memory_info().rss
+        except PSUTIL.Error:
+            continue
+    return total // MEGABYTE
+
+
+class MemoryGovernor:
+    """
+    Track every browser launched by Udemate and hold back new page leases while their combined
+    memory exceeds `budget` MB. A budget of 0 disables the governor.
+    """
+
+    def __init__(self, *, budget: int, logger: Logger) -> None:
+        self.logger = logger
+        self.budget = budget
+        if budget and PSUTIL is None:
+            self.logger.warning(
+                'Browser memory budget set but the psutil package is not installed. '
+                'Only page counts recycle drivers.')
+            self.budget = 0
+        self.drivers: set[uc.Chrome] = set()
+        self.lock = threading.Lock()
+
+    def track(self, driver: uc.Chrome) -> None:
+        """Count memory of a launched browser towards the budget."""
+        with self.lock:
+            self.drivers.add(driver)
+
+    def untrack(self, driver: uc.Chrome) -> None:
+        """Stop counting memory of a browser that quit."""
+        with self.lock:
+            self.drivers.discard(driver)
+
+    def usage(self) -> int:
+        """Return combined resident memory in MB of every tracked browser."""
+        with self.lock:
+            drivers: list[uc.Chrome] = list(self.drivers)
+        return sum(driver_memory(driver) for driver in drivers)
+
+    def over_budget(self) -> bool:
+        """Return a flag indicating whether tracked browsers use more memory than allowed."""
+        return bool(self.budget) and self.usage() > self.budget
+
+    def wait(self) -> None:
+        """Block until tracked browsers fit the budget again, or give up after `MAX_WAIT`."""
+        if not self.over_budget():
+            return
+        self.logger.warning('Browsers use more than %d MB. Holding back new pages...',
+                            self.budget)
+        deadline: float = time.monotonic() + MAX_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            if not self.over_budget():
+                return
+        self.logger.warning('Browsers still use %d MB after %.0fs. Proceeding anyway.',
+                            self.usage(), MAX_WAIT)